@@ -2,9 +2,14 @@
 
 import logging
 
+from pyagentx3.oid import OID
+from pyagentx3.varbind import VarBind
 from pyagentx3.updater import Updater
-from pyagentx3.agent import Agent
+from pyagentx3.table import Table, TableError
+from pyagentx3.agent import Agent, AsyncAgent
 from pyagentx3.sethandler import SetHandler, SetHandlerError
+from pyagentx3.provider import Provider
+from pyagentx3.session import ResponseError
 
 
 def setup_logging(debug=False):
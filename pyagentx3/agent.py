@@ -10,73 +10,126 @@ logger.addHandler(NullHandler())
 # --------------------------------------------
 
 import time
-from queue import Queue
+import asyncio
 import pyagentx3
+from pyagentx3.oid import OID
 from pyagentx3.updater import Updater
+from pyagentx3.provider import Provider, ProviderSegment
 from pyagentx3.network import Network
+from pyagentx3.mailbox import WakeupMailbox, AsyncMailbox
+from pyagentx3.aionetwork import AsyncNetwork
+from pyagentx3.scheduler import Scheduler, UPDATE_WORKERS
+from pyagentx3.transport import parse_address, TransportError
 
 
 class AgentError(Exception):
     pass
 
 
+def _valid_oid(oid):
+    # cleanup and test oid
+    try:
+        oid = OID(oid)
+    except (ValueError, AttributeError):
+        raise AgentError('OID isn\'t valid')
+    if not oid.subids:
+        raise AgentError('OID isn\'t valid')
+    return oid
+
+
 class Agent():
 
-    def __init__(self, agent_id='MyAgent', socket_path=None):
+    def __init__(self, agent_id='MyAgent', socket_path=None,
+                 update_workers=UPDATE_WORKERS, process_workers=None,
+                 consistent_walks=False, send_buffer=None, capture=None):
         self.agent_id = agent_id
+        # Unix socket path or 'tcp:host:port'
         self.socket_path = socket_path if socket_path else pyagentx3.SOCKET_PATH
+        try:
+            parse_address(self.socket_path)
+        except TransportError as e:
+            raise AgentError(str(e))
+        self.send_buffer = send_buffer
+        # pyagentx3.capture.Capture recording all PDUs of the session
+        self.capture = capture
+        self.update_workers = update_workers
+        self.process_workers = process_workers
+        self.consistent_walks = consistent_walks
         self._updater_list = []
         self._sethandlers = {}
+        self._providers = {}
         self._threads = []
 
-    def register(self, oid, class_, freq=10, data_store=None):
+    def register(self, oid, class_, freq=10, data_store=None, pre_encode=False,
+                 process=False, delta=False):
         if not issubclass(class_, Updater):
             raise AgentError('Class given isn\'t an updater')
 
-        # cleanup and test oid
-        try:
-            oid = oid.strip(' .')
-            _ = [int(i) for i in oid.split('.')]
-        except ValueError:
-            raise AgentError('OID isn\'t valid')
+        oid = _valid_oid(oid)
         self._updater_list.append({
             'oid': oid,
             'class': class_,
             'data_store': data_store,
-            'freq': freq})
+            'freq': freq,
+            'pre_encode': pre_encode,
+            'process': process,
+            'delta': delta})
 
     def register_set(self, oid, class_, data_store=None):
         if not issubclass(class_, pyagentx3.SetHandler):
             raise AgentError('Class given isn\'t a SetHandler')
 
-        # cleanup and test oid
-        try:
-            oid = oid.strip(' .')
-            _ = [int(i) for i in oid.split('.')]
-        except ValueError:
-            raise AgentError('OID isn\'t valid')
+        oid = _valid_oid(oid)
         self._sethandlers[oid] = class_(data_store=data_store)
 
+    def register_provider(self, oid, class_, data_store=None):
+        if not issubclass(class_, Provider):
+            raise AgentError('Class given isn\'t a Provider')
+
+        oid = _valid_oid(oid)
+        self._providers[oid] = class_(data_store=data_store)
+
+    def _oid_list(self):
+        return ([u['oid'] for u in self._updater_list] +
+                list(self._providers))
+
+    def _add_providers(self, network):
+        # Providers are called from the network, they don't need an update
+        # cycle of their own.
+        for oid, provider in self._providers.items():
+            network.mib.replace(ProviderSegment(oid, provider))
+
     def setup(self):
         # Override this
         pass
 
+    def registered(self, oid, error):
+        # Override this, called from the network after each registration
+        # with None or the ResponseError of the master.
+        pass
+
     def start(self):
-        queue = Queue(maxsize=20)
+        queue = WakeupMailbox()
         self.setup()
 
-        # Start Updaters
+        # Start Updaters, all run from one shared scheduler
+        scheduler = Scheduler(self.update_workers, self.process_workers)
         for u in self._updater_list:
             logger.debug('Starting updater [%s]', u['oid'])
-            thread = u['class'](data_store=u['data_store'])
-            thread.agent_setup(queue, u['oid'], u['freq'])
-            thread.start()
-            self._threads.append(thread)
+            updater = u['class'](data_store=u['data_store'])
+            updater.agent_setup(queue, u['oid'], u['freq'], u['pre_encode'],
+                u['delta'])
+            scheduler.add(updater, u['process'])
+        scheduler.start()
+        self._threads.append(scheduler)
 
         # Start Network
-        oid_list = [u['oid'] for u in self._updater_list]
-        thread = Network(queue, oid_list, self._sethandlers,
-            self.agent_id, self.socket_path)
+        thread = Network(queue, self._oid_list(), self._sethandlers,
+            self.agent_id, self.socket_path, self.consistent_walks,
+            self.send_buffer)
+        self._add_providers(thread)
+        thread.on_register = self.registered
+        thread.capture = self.capture
         thread.start()
         self._threads.append(thread)
 
@@ -93,3 +146,66 @@ class Agent():
         for thread in self._threads:
             thread.join(10)
 
+
+class AsyncAgent(Agent):
+
+    # Same API as Agent but network and updaters run as tasks in a single
+    # asyncio event loop instead of one thread each.
+
+    def __init__(self, agent_id='MyAgent', socket_path=None,
+                 consistent_walks=False, send_buffer=None, capture=None):
+        super().__init__(agent_id, socket_path,
+            consistent_walks=consistent_walks, send_buffer=send_buffer,
+            capture=capture)
+        self._loop = None
+        self._tasks = []
+
+    def start(self):
+        asyncio.run(self.run())
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        queue = AsyncMailbox()
+        self.setup()
+
+        # Start Updaters
+        for u in self._updater_list:
+            if u['process']:
+                raise AgentError('AsyncAgent can\'t run updaters in processes')
+            logger.debug('Starting updater [%s]', u['oid'])
+            updater = u['class'](data_store=u['data_store'])
+            updater.agent_setup(queue, u['oid'], u['freq'], u['pre_encode'],
+                u['delta'])
+            self._threads.append(updater)
+            self._tasks.append(asyncio.create_task(updater.async_run()))
+
+        # Start Network
+        network = AsyncNetwork(queue, self._oid_list(), self._sethandlers,
+            self.agent_id, self.socket_path, self.consistent_walks,
+            self.send_buffer)
+        self._add_providers(network)
+        network.on_register = self.registered
+        network.capture = self.capture
+        self._tasks.append(asyncio.create_task(network.run()))
+
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            logger.debug('Agent stopped')
+
+    def stop(self):
+        logger.debug('Stop tasks')
+        for updater in self._threads:
+            updater.stop.set()
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            # All at once, the loop closes as soon as the first one is done
+            self._loop.call_soon_threadsafe(self._cancel_tasks)
+        except RuntimeError:
+            # Loop closed in the meantime
+            pass
+
+    def _cancel_tasks(self):
+        for task in self._tasks:
+            task.cancel()
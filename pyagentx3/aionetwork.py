@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.aionetwork')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import socket
+import asyncio
+import pyagentx3
+from pyagentx3.pdu import PDU
+from pyagentx3.session import Session
+from pyagentx3.transport import parse_address, configure_socket
+
+
+class AsyncNetwork(Session):
+
+    # Network engine running in an asyncio event loop. Requests are read
+    # with a stream reader and dispatched as soon as they arrive, updates
+    # and traps are taken from the mailbox as soon as they are put.
+
+    def __init__(self, queue, oid_list, sethandlers, agent_id, socket_path,
+                 consistent_walks=False, send_buffer=None):
+        Session.__init__(self, oid_list, sethandlers, agent_id,
+            consistent_walks)
+        self.stop = asyncio.Event()
+        self._socket_path = socket_path
+        self._send_buffer = send_buffer
+        self._queue = queue
+        self._reader = None
+        self._writer = None
+        # Like the threaded Network updates and traps are only taken
+        # while a session is open
+        self._open = asyncio.Event()
+
+    async def _connect(self):
+        while True:
+            try:
+                logger.info("Try to open socket on ({})".format(self._socket_path))
+                family, address = parse_address(self._socket_path)
+                if family == socket.AF_UNIX:
+                    self._reader, self._writer = await asyncio.open_unix_connection(
+                        address)
+                else:
+                    self._reader, self._writer = await asyncio.open_connection(
+                        *address)
+                configure_socket(self._writer.get_extra_info('socket'),
+                    self._send_buffer)
+                logger.info("Opened socket on ({})".format(self._socket_path))
+                return
+            except OSError:
+                logger.error("Failed to connect, sleeping and retrying later")
+                await asyncio.sleep(2)
+
+    def _close(self):
+        self._open.clear()
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    def send_pdu(self, pdu, force=False):
+        log_level = logging.INFO if force else logging.DEBUG
+        if self.debug or force:
+            logger.log(log_level, "---- Sent PDU:")
+            pdu.dump()
+        if self._writer is None:
+            logger.error("Not connected, PDU dropped")
+            return
+        buf = pdu.encode()
+        if self.capture is not None:
+            self.capture.sent(buf)
+        self._writer.write(buf)
+
+    async def recv_pdu(self):
+        # Returns None if the master closed the connection.
+        try:
+            hdr_buf = await self._reader.readexactly(pyagentx3.AX_PDU_HDR_LEN)
+            hdr = PDU.decode_header(hdr_buf)
+            while not isinstance(hdr, dict):
+                # Skip invalid PDU header
+                hdr_buf = await self._reader.readexactly(pyagentx3.AX_PDU_HDR_LEN)
+                hdr = PDU.decode_header(hdr_buf)
+            payload = await self._reader.readexactly(hdr["payload_length"])
+        except asyncio.IncompleteReadError:
+            return None
+
+        if self.debug:
+            logger.debug("---- Received PDU:")
+        buf = hdr_buf + payload
+        if self.capture is not None:
+            self.capture.received(buf)
+        pdu = PDU()
+        pdu.decode(buf)
+        if self.debug:
+            pdu.dump()
+        return pdu
+
+    async def _get_updates(self):
+        while True:
+            await self._open.wait()
+            items = await self._queue.get()
+            if not self._open.is_set():
+                # Connection lost while waiting, keep them for the next
+                # session
+                for item in items:
+                    self._queue.put_nowait(item)
+                continue
+            for item in items:
+                self._apply_update(item)
+
+    async def run(self):
+        updates = asyncio.create_task(self._get_updates())
+        try:
+            while not self.stop.is_set():
+                try:
+                    await self._start_network()
+                except (OSError, asyncio.IncompleteReadError):
+                    logger.error("Network error, master disconnect?!")
+                finally:
+                    self._close()
+                    self._fail_pending(ConnectionError("Connection closed"))
+        finally:
+            updates.cancel()
+
+    async def _start_network(self):
+        await self._connect()
+
+        logger.info("==== Open PDU ====")
+        pdu = self.new_pdu(pyagentx3.AGENTX_OPEN_PDU)
+        self.send_pdu(pdu)
+        pdu = await self.recv_pdu()
+        if not pdu:
+            raise ConnectionError("Connection closed during open")
+        self.session_id = pdu.session_id
+
+        logger.info("==== Ping PDU ====")
+        self.send_request(self.new_pdu(pyagentx3.AGENTX_PING_PDU))
+
+        logger.info("==== Register PDU ====")
+        self.start_registration()
+        self._open.set()
+
+        logger.info("==== Waiting for PDU ====")
+        while not self.stop.is_set():
+            request = await self.recv_pdu()
+            if not request:
+                logger.error("Empty PDU, connection closed!")
+                raise ConnectionError("Connection closed")
+
+            response = self._dispatch(request)
+            if response:
+                self.send_pdu(response)
+            await self._writer.drain()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.capture')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import os
+import sys
+import stat
+import time
+import socket
+import struct
+import argparse
+import threading
+from collections import deque
+import pyagentx3
+from pyagentx3.pdu import PDU
+from pyagentx3.transport import parse_address
+
+
+# Capture file: CAPTURE_MAGIC followed by records of a header (timestamp,
+# direction, length) and the raw PDU as it was on the wire
+CAPTURE_MAGIC = b'PYAGENTX3CAP\x00\x00\x00\x01'
+_RECORD_HDR = struct.Struct('!dBL')
+_SESSION_ID = struct.Struct('!L')
+# Direction of a captured PDU, seen from the agent
+RECEIVED = 0
+SENT = 1
+DIRECTION_NAME = {RECEIVED: 'recv', SENT: 'sent'}
+# Number of PDUs kept in memory
+CAPTURE_SIZE = 1000
+# Seconds without a PDU from the agent until replay starts sending requests
+REPLAY_SETTLE = 1.0
+
+
+class CaptureError(Exception):
+    pass
+
+
+class Capture():
+
+    # Records the raw PDUs of a session with a timestamp. The last size
+    # PDUs are kept in a ring buffer, if path is given all of them are
+    # also appended to a capture file. Nothing is decoded or formatted
+    # while recording.
+
+    def __init__(self, path=None, size=CAPTURE_SIZE):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=size)
+        self._file = None
+        if path:
+            self._file = open(path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(CAPTURE_MAGIC)
+
+    def record(self, direction, buf):
+        data = bytes(buf)
+        record = (time.time(), direction, data)
+        with self._lock:
+            self._records.append(record)
+            if self._file is not None:
+                self._file.write(_RECORD_HDR.pack(record[0], direction,
+                    len(data)) + data)
+
+    def received(self, buf):
+        self.record(RECEIVED, buf)
+
+    def sent(self, buf):
+        self.record(SENT, buf)
+
+    def records(self):
+        # (timestamp, direction, data) of the PDUs in the ring buffer
+        with self._lock:
+            return list(self._records)
+
+    def save(self, path):
+        # Write the ring buffer to a new capture file
+        with open(path, 'wb') as f:
+            f.write(CAPTURE_MAGIC)
+            for timestamp, direction, data in self.records():
+                f.write(_RECORD_HDR.pack(timestamp, direction, len(data)) +
+                    data)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(path):
+    # Yields (timestamp, direction, data) of all PDUs in a capture file
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise CaptureError('Not a capture file: %s' % path)
+        while True:
+            hdr = f.read(_RECORD_HDR.size)
+            if not hdr:
+                return
+            if len(hdr) < _RECORD_HDR.size:
+                raise CaptureError('Truncated record header in %s' % path)
+            timestamp, direction, length = _RECORD_HDR.unpack(hdr)
+            data = f.read(length)
+            if len(data) < length:
+                raise CaptureError('Truncated record in %s' % path)
+            yield timestamp, direction, data
+
+
+def decode_capture(path):
+    # Yields (timestamp, direction, pdu) with the decoded PDUs of a
+    # capture file
+    for timestamp, direction, data in read_capture(path):
+        pdu = PDU()
+        pdu.decode(data)
+        yield timestamp, direction, pdu
+
+
+def format_pdu(timestamp, direction, pdu):
+    # Text lines describing a captured PDU
+    lines = ['%s.%06d %s %s session %d transaction %d packet %d' % (
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
+        int((timestamp % 1) * 1000000), DIRECTION_NAME.get(direction, '?'),
+        pyagentx3.PDU_TYPE_NAME.get(pdu.type, pdu.type), pdu.session_id,
+        pdu.transaction_id, pdu.packet_id)]
+    if pdu.type == pyagentx3.AGENTX_OPEN_PDU:
+        lines.append('    timeout %d oid %s description %r' % (pdu.timeout,
+            pdu.oid or '-', pdu.agent_id))
+    elif pdu.type == pyagentx3.AGENTX_CLOSE_PDU:
+        lines.append('    reason %d' % pdu.reason)
+    elif pdu.type in [pyagentx3.AGENTX_REGISTER_PDU,
+                      pyagentx3.AGENTX_UNREGISTER_PDU]:
+        line = '    %s priority %d' % (pdu.oid, pdu.priority)
+        if pdu.range_subid:
+            line += ' range_subid %d upper_bound %d' % (pdu.range_subid,
+                pdu.upper_bound)
+        lines.append(line)
+    if hasattr(pdu, 'response'):
+        lines.append('    error %s index %d' % (pdu.response['error_name'],
+            pdu.response['index']))
+    if hasattr(pdu, 'non_repeaters'):
+        lines.append('    non_repeaters %d max_repetitions %d' % (
+            pdu.non_repeaters, pdu.max_repetitions))
+    for start, end, include in getattr(pdu, 'range_list', []):
+        lines.append('    %s%s - %s' % ('[i] ' if include else '', start,
+            end or ''))
+    for value in pdu.values:
+        # Decoded values keep the value in 'data'
+        lines.append('    %s = %s: %r' % (value['name'],
+            pyagentx3.TYPE_NAME.get(value['type'], value['type']),
+            value.get('data', value.get('value'))))
+    return lines
+
+
+# ====================================================
+# replay
+
+def _listen(address):
+    family, address = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        try:
+            if stat.S_ISSOCK(os.stat(address).st_mode):
+                os.unlink(address)
+        except FileNotFoundError:
+            pass
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(1)
+    return sock
+
+
+class _Master():
+
+    # Minimal master side of a session: accepts everything the agent
+    # sends and collects the responses to our requests.
+
+    def __init__(self, sock, session_id=1):
+        self.socket = sock
+        self.session_id = session_id
+        self._buf = bytearray()
+        self.responses = {}
+
+    def _read(self):
+        data = self.socket.recv(65536)
+        if not data:
+            raise CaptureError('Agent closed the connection')
+        self._buf += data
+        while len(self._buf) >= pyagentx3.AX_PDU_HDR_LEN:
+            hdr = PDU.decode_header(self._buf)
+            if hdr is None:
+                raise CaptureError('Invalid PDU header from agent')
+            length = pyagentx3.AX_PDU_HDR_LEN + hdr['payload_length']
+            if len(self._buf) < length:
+                break
+            data = bytes(self._buf[:length])
+            del self._buf[:length]
+            self._handle(hdr, data)
+
+    def _handle(self, hdr, data):
+        if hdr['pdu_type'] == pyagentx3.AGENTX_RESPONSE_PDU:
+            self.responses[hdr['packet_id']] = data
+            return
+        # Every request of the agent succeeds
+        response = PDU(pyagentx3.AGENTX_RESPONSE_PDU)
+        response.session_id = self.session_id
+        response.transaction_id = hdr['transaction_id']
+        response.packet_id = hdr['packet_id']
+        self.socket.sendall(response.encode())
+
+    def settle(self, timeout):
+        # Serve the agent until it has been quiet for timeout seconds
+        self.socket.settimeout(timeout)
+        try:
+            while True:
+                self._read()
+        except socket.timeout:
+            pass
+        finally:
+            self.socket.settimeout(None)
+
+    def request(self, data):
+        # Send a request and wait for the response to it
+        buf = bytearray(data)
+        _SESSION_ID.pack_into(buf, 4, self.session_id)
+        pdu = PDU()
+        pdu.decode(buf)
+        self.socket.sendall(buf)
+        while pdu.packet_id not in self.responses:
+            self._read()
+        return pdu, self.responses.pop(pdu.packet_id)
+
+
+def replay(path, address, speed=0, settle=REPLAY_SETTLE):
+    # Play the requests of a capture file to an agent: listens on address
+    # as master, waits for the agent to connect and register, then sends
+    # the captured requests one by one. speed 0 sends them as fast as
+    # possible, otherwise with the captured timing divided by speed.
+    # Yields (request, response, expected) with the decoded request and
+    # response PDUs and whether the response is the captured one (None
+    # if the capture has no response).
+    records = list(read_capture(path))
+    expected = {}
+    for _, direction, data in records:
+        hdr = PDU.decode_header(data)
+        if (direction == SENT and
+                hdr['pdu_type'] == pyagentx3.AGENTX_RESPONSE_PDU):
+            expected[hdr['packet_id']] = data
+    requests = []
+    for timestamp, direction, data in records:
+        hdr = PDU.decode_header(data)
+        if (direction == RECEIVED and
+                hdr['pdu_type'] != pyagentx3.AGENTX_RESPONSE_PDU):
+            requests.append((timestamp, data))
+
+    server = _listen(address)
+    try:
+        sock, _ = server.accept()
+    finally:
+        server.close()
+    try:
+        master = _Master(sock)
+        master.settle(settle)
+        start = time.monotonic()
+        for timestamp, data in requests:
+            if speed:
+                delay = (timestamp - requests[0][0]) / speed - (
+                    time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            request, response = master.request(data)
+            match = None
+            captured = expected.get(request.packet_id)
+            if captured is not None:
+                # The session id differs, the payload must not
+                match = (captured[pyagentx3.AX_PDU_HDR_LEN:] ==
+                         response[pyagentx3.AX_PDU_HDR_LEN:])
+            pdu = PDU()
+            pdu.decode(response)
+            yield request, pdu, match
+    finally:
+        sock.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m pyagentx3.capture',
+        description='Decode or replay pyagentx3 capture files')
+    commands = parser.add_subparsers(dest='command')
+    cmd = commands.add_parser('decode', help='print the PDUs of a capture')
+    cmd.add_argument('path')
+    cmd = commands.add_parser('replay',
+        help='act as master and send the captured requests to an agent')
+    cmd.add_argument('path')
+    cmd.add_argument('address', help='socket path or tcp:host:port to listen on')
+    cmd.add_argument('--speed', type=float, default=0,
+        help='replay with captured timing divided by SPEED (default: no delays)')
+    cmd.add_argument('--settle', type=float, default=REPLAY_SETTLE,
+        help='seconds the agent must be quiet after connecting')
+    args = parser.parse_args(args)
+
+    try:
+        if args.command == 'decode':
+            for record in decode_capture(args.path):
+                print('\n'.join(format_pdu(*record)))
+        elif args.command == 'replay':
+            differing = 0
+            for request, response, match in replay(args.path, args.address,
+                                                   args.speed, args.settle):
+                if match is False:
+                    differing += 1
+                print('\n'.join(format_pdu(time.time(), RECEIVED, request)))
+                print('\n'.join(format_pdu(time.time(), SENT, response)))
+                if match is not None:
+                    print('    %s' % ('same as captured' if match else
+                        'DIFFERS from captured'))
+            return 1 if differing else 0
+        else:
+            parser.print_help()
+            return 2
+    except (OSError, CaptureError) as e:
+        print('Error: %s' % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.mailbox')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import socket
+import asyncio
+import threading
+from queue import Full
+from collections import OrderedDict, deque
+
+
+# Max. number of traps waiting to be sent
+TRAP_QUEUE_SIZE = 1000
+
+
+class UpdateMailbox():
+
+    # Channel from the updaters to the network. Keeps at most one pending
+    # update per subtree: a newer snapshot replaces the pending one, a
+    # delta is merged into it, so updates are never dropped and the
+    # network never applies stale ones. Traps are kept in a separate
+    # bounded FIFO and are taken before the updates.
+
+    def __init__(self, trap_size=TRAP_QUEUE_SIZE):
+        self._lock = threading.Lock()
+        self._updates = OrderedDict()
+        self._traps = deque()
+        self._trap_size = trap_size
+
+    def put_nowait(self, item):
+        # Same interface as Queue, only a full trap FIFO raises Full
+        with self._lock:
+            if 'trap_oid' in item:
+                if len(self._traps) >= self._trap_size:
+                    raise Full
+                self._traps.append(item)
+            else:
+                pending = self._updates.pop(item['oid'], None)
+                if pending is not None:
+                    item = self._merge(pending, item)
+                self._updates[item['oid']] = item
+        self._notify()
+
+    @staticmethod
+    def _merge(pending, item):
+        if 'changed' not in item:
+            # A snapshot replaces whatever is pending
+            return item
+        changed, removed = item['changed'], item['removed']
+        if 'segment' in pending:
+            # Not yet seen by the network, can be changed in place
+            pending['segment'].apply_delta(changed, removed)
+            return pending
+        if 'data' in pending:
+            data = pending['data']
+            for name in removed:
+                data.pop(name, None)
+            data.update(changed)
+            return pending
+        merged = dict(pending['changed'])
+        for name in removed:
+            merged.pop(name, None)
+        merged.update(changed)
+        return {'oid': item['oid'],
+                'changed': merged,
+                'removed': list((set(pending['removed']) - changed.keys()) |
+                                set(removed))}
+
+    def take(self):
+        # All pending items, traps first
+        with self._lock:
+            items = list(self._traps)
+            items.extend(self._updates.values())
+            self._traps.clear()
+            self._updates.clear()
+        return items
+
+    def _notify(self):
+        pass
+
+
+class WakeupMailbox(UpdateMailbox):
+
+    # Mailbox which can be waited on with selectors together with the
+    # AgentX socket. Every put signals the read end of a socketpair.
+
+    def __init__(self, trap_size=TRAP_QUEUE_SIZE):
+        super().__init__(trap_size)
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+    def _notify(self):
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            self._wakeup_w.send(b'\x00')
+        except BlockingIOError:
+            # Enough wakeups pending already
+            pass
+
+    def clear_wakeup(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def fileno(self):
+        return self._wakeup_r.fileno()
+
+
+class AsyncMailbox(UpdateMailbox):
+
+    # Mailbox for AsyncAgent, updaters and network share one event loop
+
+    def __init__(self, trap_size=TRAP_QUEUE_SIZE):
+        super().__init__(trap_size)
+        self._event = asyncio.Event()
+
+    def _notify(self):
+        self._event.set()
+
+    async def get(self):
+        # Wait until there are pending items and take them
+        while True:
+            items = self.take()
+            if items:
+                return items
+            self._event.clear()
+            await self._event.wait()
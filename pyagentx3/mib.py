@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.mib')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import time
+from array import array
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from operator import itemgetter
+from pyagentx3.oid import OID, _subids_struct
+from pyagentx3.tools import oid_to_tuple
+from pyagentx3.trie import OIDTrie
+from pyagentx3.varbind import VarBind
+
+
+# Number of walk positions remembered with consistent walks
+WALK_PIN_SIZE = 1024
+# Seconds a walk position is remembered, a walk whose next GETNEXT comes
+# later continues on the current version
+WALK_PIN_TTL = 5
+# Max. number of OIDs a delta adds or removes one by one, bigger deltas
+# rebuild the segment at once
+DELTA_SPLICE_MAX = 64
+
+
+class MIBSegment():
+
+    # Snapshot of the values of one registered subtree as delivered by its
+    # updater, kept sorted in OID order. Built by the updater, so the
+    # network can swap it in at once. Only delta updates change a segment
+    # afterwards, see MIB.apply_delta.
+    #
+    # To keep large subtrees compact there is no object per value: the
+    # sub-identifiers below the subtree prefix of all keys are packed into
+    # one buffer (4 octets each, big-endian, so they compare like the
+    # tuples), types, values and pre-encoded varbinds are kept in parallel
+    # arrays. Names and VarBinds are only built for values returned.
+
+    def __init__(self, oid, data):
+        self.oid = oid
+        self.key = oid_to_tuple(oid)
+        self._set_rows(sorted([(_pack_key(oid_to_tuple(row['name'])),
+            row['type'], row['value'], row.get('varbind'))
+            for row in data.values()], key=itemgetter(0)))
+
+    def _set_rows(self, rows):
+        # rows are sorted (packed key, type, value, varbind) tuples
+        self._key_buf = b''.join([row[0] for row in rows])
+        self._key_pos = array('L', [0])
+        pos = 0
+        for row in rows:
+            pos += len(row[0])
+            self._key_pos.append(pos)
+        self.types = array('B', [row[1] for row in rows])
+        self.values = [row[2] for row in rows]
+        # Position of the last value returned by get_next()
+        self._hint = 0
+        # Only kept if there are pre-encoded varbinds at all
+        self.varbinds = None
+        if any(row[3] is not None for row in rows):
+            self.varbinds = [row[3] for row in rows]
+
+    def _rows(self):
+        for idx in range(len(self)):
+            yield (self._packed(idx), self.types[idx], self.values[idx],
+                   self.varbinds[idx] if self.varbinds else None)
+
+    def __len__(self):
+        return len(self._key_pos) - 1
+
+    def _packed(self, idx):
+        return self._key_buf[self._key_pos[idx]:self._key_pos[idx + 1]]
+
+    def _bisect(self, packed, right=False):
+        # Position of packed in the sorted keys, like bisect_left or
+        # bisect_right
+        buf, pos = self._key_buf, self._key_pos
+        # A walk continues at the value returned last, no search needed
+        hint = self._hint
+        if hint < len(pos) - 1 and buf[pos[hint]:pos[hint + 1]] == packed:
+            return hint + 1 if right else hint
+        lo, hi = 0, len(pos) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = buf[pos[mid]:pos[mid + 1]]
+            if key < packed or (right and key == packed):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, packed):
+        idx = self._bisect(packed)
+        if idx < len(self) and self._packed(idx) == packed:
+            return idx
+        return None
+
+    def _full(self, idx):
+        # The name is built from the sub-identifiers, no string parsing
+        start = self._key_pos[idx]
+        key = self.key + _subids_struct((self._key_pos[idx + 1] - start) // 4
+            ).unpack_from(self._key_buf, start)
+        varbind = self.varbinds[idx] if self.varbinds else None
+        return key, VarBind(OID(key), self.types[idx], self.values[idx],
+            varbind)
+
+    def copy(self):
+        # The key buffer is never changed in place, only replaced
+        segment = MIBSegment.__new__(MIBSegment)
+        segment.oid = self.oid
+        segment.key = self.key
+        segment._key_buf = self._key_buf
+        segment._key_pos = self._key_pos
+        segment.types = array('B', self.types)
+        segment.values = list(self.values)
+        segment.varbinds = list(self.varbinds) if self.varbinds else None
+        segment._hint = 0
+        return segment
+
+    def apply_delta(self, changed, removed):
+        # Change the segment in place. Changed values of existing OIDs are
+        # set directly, added and removed OIDs are spliced in at their
+        # bisect position without re-sorting. Only a delta adding or
+        # removing more than DELTA_SPLICE_MAX OIDs rebuilds the segment.
+        removed = [packed for packed in
+                   (_pack_key(oid_to_tuple(name)) for name in removed)
+                   if self._find(packed) is not None]
+        added = []
+        for row in changed.values():
+            packed = _pack_key(oid_to_tuple(row['name']))
+            idx = self._find(packed)
+            if idx is None:
+                added.append((packed, row['type'], row['value'],
+                    row.get('varbind')))
+            else:
+                self._set_value(idx, row['type'], row['value'],
+                    row.get('varbind'))
+        if len(removed) + len(added) > DELTA_SPLICE_MAX:
+            removed = set(removed)
+            rows = [row for row in self._rows() if row[0] not in removed]
+            rows.extend(added)
+            rows.sort(key=itemgetter(0))
+            self._set_rows(rows)
+            return
+        for packed in removed:
+            self._remove(self._find(packed))
+        for packed, type_, value, varbind in added:
+            self._insert(self._bisect(packed), packed, type_, value, varbind)
+
+    def _set_value(self, idx, type_, value, varbind):
+        self.types[idx] = type_
+        self.values[idx] = value
+        if varbind is not None and self.varbinds is None:
+            self.varbinds = [None] * len(self)
+        if self.varbinds is not None:
+            self.varbinds[idx] = varbind
+
+    # Key buffer and offsets are replaced, not changed in place, so copies
+    # can keep sharing them. Only the offsets behind idx are shifted.
+
+    def _insert(self, idx, packed, type_, value, varbind):
+        pos = self._key_pos
+        start, size = pos[idx], len(packed)
+        self._key_buf = self._key_buf[:start] + packed + self._key_buf[start:]
+        self._key_pos = (pos[:idx + 1] + array('L', [start + size]) +
+                         array('L', [p + size for p in pos[idx + 1:]]))
+        self.types.insert(idx, type_)
+        self.values.insert(idx, value)
+        if varbind is not None and self.varbinds is None:
+            self.varbinds = [None] * (len(self) - 1)
+        if self.varbinds is not None:
+            self.varbinds.insert(idx, varbind)
+
+    def _remove(self, idx):
+        pos = self._key_pos
+        start, end = pos[idx], pos[idx + 1]
+        self._key_buf = self._key_buf[:start] + self._key_buf[end:]
+        size = end - start
+        self._key_pos = pos[:idx + 1] + array('L',
+            [p - size for p in pos[idx + 2:]])
+        del self.types[idx]
+        del self.values[idx]
+        if self.varbinds is not None:
+            del self.varbinds[idx]
+
+    def get(self, key):
+        if key[:len(self.key)] != self.key:
+            return None
+        idx = self._find(_pack_key(key[len(self.key):]))
+        if idx is None:
+            return None
+        return self._full(idx)[1]
+
+    def get_next(self, start, include=0):
+        head = start[:len(self.key)]
+        if head < self.key:
+            # start is before this subtree
+            idx = 0
+        elif head > self.key:
+            # start is behind this subtree
+            return None, None
+        else:
+            idx = self._bisect(_pack_key(start[len(self.key):]),
+                right=not include)
+        if idx >= len(self):
+            return None, None
+        self._hint = idx
+        return self._full(idx)
+
+
+def _pack_key(subids):
+    return _subids_struct(len(subids)).pack(*subids)
+
+
+class MIB():
+
+    # All values served by the agent as a set of independent, per subtree
+    # segments. An update only swaps the segment of its own subtree, the
+    # other subtrees are left untouched.
+    #
+    # With consistent_walks a walk keeps reading the segment version it
+    # started on: the segment each GETNEXT answer came from is remembered,
+    # a following GETNEXT starting at that answer continues on the same
+    # version even if the subtree was updated in between. Positions are
+    # forgotten after WALK_PIN_TTL seconds, so a finished walk doesn't
+    # keep old versions alive.
+
+    def __init__(self, consistent_walks=False):
+        # Segments by root OID, roots also kept sorted for GETNEXT
+        self._segments = OIDTrie()
+        self._roots = []
+        self._consistent_walks = consistent_walks
+        # {key: (segment, time pinned)}, oldest first
+        self._pinned = OrderedDict()
+
+    def update(self, oid, data):
+        self.replace(MIBSegment(oid, data))
+
+    def replace(self, segment):
+        self._expire_pins()
+        if segment.key not in self._segments:
+            insort(self._roots, segment.key)
+        self._segments[segment.key] = segment
+
+    def apply_delta(self, oid, changed, removed):
+        key = oid_to_tuple(oid)
+        segment = self._segments.get(key)
+        if segment is None:
+            self.replace(MIBSegment(oid, changed))
+            return
+        if self._consistent_walks and self._is_pinned(segment):
+            # Running walks keep their version, change a copy
+            segment = segment.copy()
+            segment.apply_delta(changed, removed)
+            self.replace(segment)
+        else:
+            segment.apply_delta(changed, removed)
+
+    def _expire_pins(self):
+        if not self._pinned:
+            return
+        deadline = time.monotonic() - WALK_PIN_TTL
+        while self._pinned:
+            key, (_, pinned_at) = next(iter(self._pinned.items()))
+            if pinned_at > deadline:
+                break
+            del self._pinned[key]
+
+    def _is_pinned(self, segment):
+        self._expire_pins()
+        return any(pinned is segment for pinned, _ in self._pinned.values())
+
+    def _segment(self, key, pinned):
+        # Segment rooted at key, the pinned version if any
+        if pinned is not None and pinned.key == key:
+            return pinned
+        return self._segments.get(key)
+
+    def _ancestors(self, key, pinned=None):
+        # Segments whose subtree contains key, most specific first
+        for length, segment in self._segments.prefixes(key):
+            if (pinned is not None and len(pinned.key) == length and
+                    key[:length] == pinned.key):
+                segment = pinned
+            yield segment
+
+    def get(self, oid):
+        key = oid_to_tuple(oid)
+        for segment in self._ancestors(key):
+            row = segment.get(key)
+            if row is not None:
+                return row
+        return None
+
+    def _get_next(self, start, include=0):
+        pinned = None
+        if self._consistent_walks:
+            self._expire_pins()
+            pin = self._pinned.get(start)
+            if pin is not None:
+                pinned = pin[0]
+        best_key, best_row, best_segment = None, None, None
+        # Only segments containing start or rooted after start can hold a
+        # successor of start. Segments rooted after the best match found so
+        # far can't hold a better one.
+        for segment in self._ancestors(start, pinned):
+            key, row = segment.get_next(start, include)
+            if key is not None and (best_key is None or key < best_key):
+                best_key, best_row, best_segment = key, row, segment
+        for i in range(bisect_right(self._roots, start), len(self._roots)):
+            root = self._roots[i]
+            if best_key is not None and root >= best_key:
+                break
+            segment = self._segment(root, pinned)
+            key, row = segment.get_next(start, include)
+            if key is not None and (best_key is None or key < best_key):
+                best_key, best_row, best_segment = key, row, segment
+
+        if self._consistent_walks and best_key is not None:
+            self._pinned[best_key] = (best_segment, time.monotonic())
+            self._pinned.move_to_end(best_key)
+            if len(self._pinned) > WALK_PIN_SIZE:
+                self._pinned.popitem(last=False)
+        return best_key, best_row
+
+    def walk(self, oid, endoid='', include=0):
+        # Yield the values in OID order starting at the search range
+        # given. Search range semantics as in RFC 2741 section 5.2: the
+        # start OID itself is only a match if include is set, the end OID
+        # is exclusive and a null end OID means no upper bound.
+        start = oid_to_tuple(oid)
+        end = oid_to_tuple(endoid)
+        while True:
+            key, row = self._get_next(start, include)
+            if key is None or (end and key >= end):
+                # Past last item in MIB or outside of search range
+                return
+            yield row
+            start, include = key, 0
+
+    def get_next(self, oid, endoid='', include=0):
+        # First value of the search range or None if there is no match
+        return next(self.walk(oid, endoid, include), None)
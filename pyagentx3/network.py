@@ -10,184 +10,184 @@ logger.addHandler(NullHandler())
 # --------------------------------------------
 
 import socket
+import selectors
 import time
+import itertools
 import threading
-from queue import Empty
-import struct
+from collections import deque
 import pyagentx3
 from pyagentx3.pdu import PDU
+from pyagentx3.session import Session
+from pyagentx3.tools import WakeupEvent
+from pyagentx3.transport import open_socket
 
 
-class Network(threading.Thread):
+# Initial size of receive buffer, grows for bigger PDUs
+RECV_BUF_SIZE = 65536
+# Seconds to wait for the master to answer a request
+MASTER_TIMEOUT = 5
+# Max. number of buffers handed to a single sendmsg() call
+SEND_IOV_MAX = 64
+# Stop reading requests while more bytes than this wait to be sent
+SEND_QUEUE_LIMIT = 4 * 1024 * 1024
 
-    def __init__(self, queue, oid_list, sethandlers, agent_id, socket_path):
+
+class Network(threading.Thread, Session):
+
+    def __init__(self, queue, oid_list, sethandlers, agent_id, socket_path,
+                 consistent_walks=False, send_buffer=None):
         threading.Thread.__init__(self)
-        self.stop = threading.Event()
-        self._agent_id = agent_id
+        Session.__init__(self, oid_list, sethandlers, agent_id,
+            consistent_walks)
+        self.stop = WakeupEvent(queue)
         self._socket_path = socket_path
+        self._send_buffer = send_buffer
         self._queue = queue
-        self._oid_list = oid_list
-        self._sethandlers = sethandlers
-        self._recv_buf = bytes()
-
-        self.session_id = 0
-        self.transaction_id = 0
-        self.debug = 1
-        # Data Related Variables
-        self.data = {}
-        self.data_idx = []
+        self._recv_buf = bytearray(RECV_BUF_SIZE)
+        self._recv_view = memoryview(self._recv_buf)
+        self._recv_start = 0
+        self._recv_end = 0
+        self._recv_pdus = deque()
+        self._send_queue = deque()
+        self._send_pending = 0
         self.socket = None
 
     def _connect(self):
         while True:
             try:
                 logger.info("Try to open socket on ({})".format(self._socket_path))
-                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                self.socket.connect(self._socket_path)
-                self.socket.settimeout(0.1)
+                self.socket = open_socket(self._socket_path,
+                    self._send_buffer, MASTER_TIMEOUT)
+                self._recv_start = self._recv_end = 0
+                self._recv_pdus.clear()
+                self._send_queue.clear()
+                self._send_pending = 0
                 logger.info("Opened socket on ({})".format(self._socket_path))
                 return
             except socket.error:
                 logger.error("Failed to connect, sleeping and retrying later")
                 time.sleep(2)
 
-    def new_pdu(self, pdu_type):
-        pdu = PDU(pdu_type, agent_id=self._agent_id)
-        pdu.session_id = self.session_id
-        pdu.transaction_id = self.transaction_id
-        self.transaction_id += 1
-        return pdu
-
-    def response_pdu(self, org_pdu):
-        pdu = PDU(pyagentx3.AGENTX_RESPONSE_PDU, agent_id=self._agent_id)
-        pdu.session_id = org_pdu.session_id
-        pdu.transaction_id = org_pdu.transaction_id
-        pdu.packet_id = org_pdu.packet_id
-        return pdu
-
     def send_pdu(self, pdu, force=False):
         log_level = logging.INFO if force else logging.DEBUG
         if self.debug or force:
             logger.log(log_level, "---- Sent PDU:")
             pdu.dump()
+        # Queued only, several PDUs go out together with flush()
         buf = pdu.encode()
-        self.socket.send(buf)
-
-    def recv_pdu(self):
-        # Try to read next n bytes from socket until at least a full
-        # PDU header is available.
-        if len(self._recv_buf) < pyagentx3.AX_PDU_HDR_LEN:
-            self._recv_buf += self.socket.recv(4096)
-            if len(self._recv_buf) < pyagentx3.AX_PDU_HDR_LEN:
-                return None
-
-        # Try to decode a PDU header from beginning of buffer.
-        hdr = PDU.decode_header(self._recv_buf[:pyagentx3.AX_PDU_HDR_LEN])
-        # If its not possible to decode a PDU header from buffer, remove
-        # invalid PDU header from buffer.
-        if not isinstance(hdr, dict):
-            self._recv_buf = self._recv_buf[pyagentx3.AX_PDU_HDR_LEN:]
+        if self.capture is not None:
+            self.capture.sent(buf)
+        self._send_queue.append(buf)
+        self._send_pending += len(buf)
+
+    def flush(self):
+        # Send queued PDUs with as few syscalls as possible. Partially sent
+        # buffers stay queued with their unsent rest. On a non-blocking
+        # socket returns False if the socket can't take all of it now.
+        while self._send_queue:
+            try:
+                sent = self.socket.sendmsg(
+                    itertools.islice(self._send_queue, SEND_IOV_MAX))
+            except (BlockingIOError, InterruptedError):
+                return False
+            self._send_pending -= sent
+            while sent:
+                buf = self._send_queue[0]
+                if sent < len(buf):
+                    self._send_queue[0] = memoryview(buf)[sent:]
+                    break
+                sent -= len(buf)
+                self._send_queue.popleft()
+        return True
+
+    def _recv_buffer_compact(self, needed):
+        # Move the incomplete PDU at the buffer start to the front and
+        # make room for at least needed bytes. Only the pending tail is
+        # copied. A bigger buffer is a new bytearray, so memoryviews
+        # still referencing the old one never block a resize.
+        pending = self._recv_end - self._recv_start
+        if needed > len(self._recv_buf):
+            buf = bytearray(max(needed, 2 * len(self._recv_buf)))
+            buf[:pending] = self._recv_view[self._recv_start:self._recv_end]
+            self._recv_buf = buf
+            self._recv_view = memoryview(buf)
+        elif self._recv_start:
+            self._recv_buf[:pending] = self._recv_buf[self._recv_start:self._recv_end]
+        self._recv_start = 0
+        self._recv_end = pending
+
+    def recv_pdus(self):
+        # Read once from socket into the receive buffer and return all
+        # complete PDUs it contains. Incomplete PDUs stay in the buffer
+        # until the rest of them arrived. Returns None if the master
+        # closed the connection.
+        if self._recv_end == len(self._recv_buf):
+            self._recv_buffer_compact(self._recv_end - self._recv_start + 1)
+        n = self.socket.recv_into(self._recv_view[self._recv_end:])
+        if n == 0:
             return None
-        payload_len = hdr["payload_length"]
-
-        # Ensure that full PDU is in buffer.
-        # Note: Max PDU payload length could be ~4GB,
-        # this could be problematic ...
-        next_pdu_len = pyagentx3.AX_PDU_HDR_LEN + payload_len
-        if len(self._recv_buf) < next_pdu_len:
-            self._recv_buf += self.socket.recv(next_pdu_len)
-            if len(self._recv_buf) < next_pdu_len:
-                return None
-
-        if self.debug:
-            logger.debug("---- Received PDU:")
+        self._recv_end += n
+
+        pdus = []
+        while self._recv_end - self._recv_start >= pyagentx3.AX_PDU_HDR_LEN:
+            # Try to decode a PDU header from beginning of buffer.
+            hdr = PDU.decode_header(self._recv_view[self._recv_start:
+                self._recv_start + pyagentx3.AX_PDU_HDR_LEN])
+            # If its not possible to decode a PDU header from buffer, remove
+            # invalid PDU header from buffer.
+            if not isinstance(hdr, dict):
+                self._recv_start += pyagentx3.AX_PDU_HDR_LEN
+                continue
 
-        # Payload length valid, so decode complete PDU.
-        pdu = PDU()
-        pdu.decode(self._recv_buf[:next_pdu_len])
-        self._recv_buf = self._recv_buf[next_pdu_len:]
+            # Ensure that full PDU is in buffer.
+            # Note: Max PDU payload length could be ~4GB,
+            # this could be problematic ...
+            next_pdu_len = pyagentx3.AX_PDU_HDR_LEN + hdr["payload_length"]
+            if self._recv_end - self._recv_start < next_pdu_len:
+                if next_pdu_len > len(self._recv_buf) - self._recv_start:
+                    self._recv_buffer_compact(next_pdu_len)
+                break
 
-        if self.debug:
-            pdu.dump()
-            logger.debug("---- Remaining buffer length ({})".format(
-                len(self._recv_buf)))
-            logger.debug("---- Buffer length ({}), PDU length ({})".format(
-                len(self._recv_buf), next_pdu_len))
+            if self.debug:
+                logger.debug("---- Received PDU:")
+
+            # Payload length valid, so decode complete PDU.
+            view = self._recv_view[self._recv_start:
+                self._recv_start + next_pdu_len]
+            if self.capture is not None:
+                self.capture.received(view)
+            pdu = PDU()
+            pdu.decode(view)
+            self._recv_start += next_pdu_len
+            pdus.append(pdu)
+
+            if self.debug:
+                pdu.dump()
+                logger.debug("---- Buffer length ({}), PDU length ({})".format(
+                    self._recv_end - self._recv_start, next_pdu_len))
+
+        if self._recv_start == self._recv_end:
+            # Buffer completely consumed
+            self._recv_start = self._recv_end = 0
+        return pdus
 
-        return pdu
+    def recv_pdu(self):
+        # Wait for the next single PDU, further PDUs received together
+        # with it are kept for the following calls. Sends queued PDUs
+        # first, used while the socket is still blocking.
+        self.flush()
+        while not self._recv_pdus:
+            pdus = self.recv_pdus()
+            if pdus is None:
+                return None
+            self._recv_pdus.extend(pdus)
+        return self._recv_pdus.popleft()
 
     # =========================================
 
     def _get_updates(self):
-        while True:
-            try:
-                item = self._queue.get_nowait()
-                #logger.info('Update: {}'.format(item))
-
-                if 'oid' in item:
-                    #logger.info('New update')
-                    update_oid = item['oid']
-                    update_data = item['data']
-                    # clear values with prefix oid
-                    for oid in list(self.data.keys()):
-                        if oid.startswith(update_oid):
-                            del self.data[oid]
-                    # insert updated value
-                    for row in list(update_data.values()):
-                        oid = "%s.%s" % (update_oid, row['name'])
-                        self.data[oid] = {'name': oid, 'type':row['type'],
-                                        'value':row['value']}
-                    # recalculate reverse index if data changed
-                    self.data_idx = sorted(list(self.data.keys()),
-                        key=lambda k: tuple(int(part) for part in k.split('.')))
-
-                elif 'trap_oid' in item:
-                    #logger.info('New traps')
-                    trap_data = item['data']
-
-                    if len(trap_data) > 0:
-                        trap_pdu = self.new_pdu(pyagentx3.AGENTX_NOTIFY_PDU)
-                        for row in list(trap_data.values()):
-                            #logger.info(row)
-                            trap_pdu.values.append(row)
-                        trap_pdu.dump()
-                        self.send_pdu(trap_pdu)
-
-            except Empty:
-                break
-
-    def _get_next_oid(self, oid, endoid):
-        if oid in self.data:
-            # Exact match found
-            #logger.debug('get_next_oid, exact match of %s' % oid)
-            idx = self.data_idx.index(oid)
-            if idx == (len(self.data_idx)-1):
-                # Last Item in MIB, No match!
-                return None
-            return self.data_idx[idx+1]
-
-        # No exact match, find prefix
-        #logger.debug('get_next_oid, no exact match of %s' % oid)
-        slist = oid.split('.')
-        elist = endoid.split('.')
-        for tmp_oid in self.data_idx:
-            tlist = tmp_oid.split('.')
-            for i in range(len(tlist)):
-                try:
-                    sok = int(slist[i]) <= int(tlist[i])
-                except IndexError:
-                    #sok = True, on most recent successful comparison
-                    pass
-                try:
-                    eok = int(elist[i]) >= int(tlist[i])
-                except IndexError:
-                    #eok = True, on most recent successful comparison
-                    pass
-                if not (sok and eok):
-                    break
-            if sok and eok:
-                return tmp_oid
-        return None # No match!
+        for item in self._queue.take():
+            self._apply_update(item)
 
     def start(self):
         while not self.stop.is_set():
@@ -195,6 +195,10 @@ class Network(threading.Thread):
                 self._start_network()
             except socket.error:
                 logger.error("Network error, master disconnect?!")
+            finally:
+                if self.socket:
+                    self.socket.close()
+                self._fail_pending(ConnectionError("Connection closed"))
 
     def _start_network(self):
         self._connect()
@@ -206,106 +210,49 @@ class Network(threading.Thread):
         self.session_id = pdu.session_id
 
         logger.info("==== Ping PDU ====")
-        pdu = self.new_pdu(pyagentx3.AGENTX_PING_PDU)
-        self.send_pdu(pdu)
-        pdu = self.recv_pdu()
+        self.send_request(self.new_pdu(pyagentx3.AGENTX_PING_PDU))
 
         logger.info("==== Register PDU ====")
-        for oid in self._oid_list:
-            logger.info("Registering: %s", oid)
-            pdu = self.new_pdu(pyagentx3.AGENTX_REGISTER_PDU)
-            pdu.oid = oid
-            self.send_pdu(pdu)
-            pdu = self.recv_pdu()
+        self.start_registration()
 
         logger.info("==== Waiting for PDU ====")
-        while True:
-            try:
+        # Wait for requests and updates without any timeout, updates and
+        # traps wake up the loop via the queue. Responses are sent once
+        # all requests at hand are processed, the rest when the socket is
+        # writable again.
+        self.socket.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            events = selectors.EVENT_READ
+            selector.register(self.socket, events, 'socket')
+            selector.register(self._queue, selectors.EVENT_READ, 'queue')
+            while not self.stop.is_set():
                 self._get_updates()
-                request = self.recv_pdu()
-            except socket.timeout:
-                if self.stop.is_set():
-                    break
-                continue
-
-            if not request:
-                logger.error("Empty PDU, connection closed!")
-                raise socket.error
-
-            response = self.response_pdu(request)
-            if request.type == pyagentx3.AGENTX_GET_PDU:
-                logger.info("Received GET PDU")
-                for rvalue in request.range_list:
-                    oid = rvalue[0]
-                    logger.debug("OID: %s", oid)
-                    if oid in self.data:
-                        logger.debug("OID Found")
-                        response.values.append(self.data[oid])
+                requests = list(self._recv_pdus)
+                self._recv_pdus.clear()
+                if not requests:
+                    if self.flush():
+                        new_events = selectors.EVENT_READ
+                    elif self._send_pending > SEND_QUEUE_LIMIT:
+                        # Master doesn't read, stop taking requests
+                        new_events = selectors.EVENT_WRITE
                     else:
-                        logger.debug("OID Not Found!")
-                        response.values.append({
-                            'type': pyagentx3.TYPE_NOSUCHOBJECT,
-                            'name': rvalue[0],
-                            'value': 0})
-
-            elif request.type == pyagentx3.AGENTX_GETNEXT_PDU:
-                logger.info("Received GET_NEXT PDU")
-                for rvalue in request.range_list:
-                    oid = self._get_next_oid(rvalue[0], rvalue[1])
-                    logger.debug("GET_NEXT: %s => %s", rvalue[0], oid)
-                    if oid:
-                        response.values.append(self.data[oid])
-                    else:
-                        response.values.append({
-                            'type': pyagentx3.TYPE_ENDOFMIBVIEW,
-                            'name': rvalue[0],
-                            'value': 0})
-
-            elif request.type == pyagentx3.AGENTX_TESTSET_PDU:
-                logger.info("Received TESTSET PDU")
-                idx = 0
-                for row in request.values:
-                    idx += 1
-                    oid = row['name']
-                    type_ = pyagentx3.TYPE_NAME.get(row['type'], 'Unknown type')
-                    value = row['data']
-                    logger.info("Name: [%s] Type: [%s] Value: [%s]", oid, type_, value)
-                    # Find matching sethandler
-                    matching_oid = ''
-                    for target_oid in self._sethandlers:
-                        if oid.startswith(target_oid):
-                            matching_oid = target_oid
-                            break
-                    if matching_oid == '':
-                        logger.debug('TestSet request failed: not writeable #%s', idx)
-                        response.error = pyagentx3.ERROR_NOTWRITABLE
-                        response.error_index = idx
-                        break
-                    try:
-                        self._sethandlers[matching_oid].network_test(
-                            request.session_id, request.transaction_id,
-                            oid, row['data'])
-                    except pyagentx3.SetHandlerError:
-                        logger.debug('TestSet request failed: wrong value #%s', idx)
-                        response.error = pyagentx3.ERROR_WRONGVALUE
-                        response.error_index = idx
-                        break
-                logger.debug('TestSet request passed')
-
-
-            elif request.type == pyagentx3.AGENTX_COMMITSET_PDU:
-                for handler in list(self._sethandlers.values()):
-                    handler.network_commit(request.session_id, request.transaction_id)
-                logger.info("Received COMMITSET PDU")
-
-            elif request.type == pyagentx3.AGENTX_UNDOSET_PDU:
-                for handler in list(self._sethandlers.values()):
-                    handler.network_undo(request.session_id, request.transaction_id)
-                logger.info("Received UNDOSET PDU")
-
-            elif request.type == pyagentx3.AGENTX_CLEANUPSET_PDU:
-                for handler in list(self._sethandlers.values()):
-                    handler.network_cleanup(request.session_id, request.transaction_id)
-                logger.info("Received CLEANUP PDU")
-
-            self.send_pdu(response)
+                        new_events = selectors.EVENT_READ | selectors.EVENT_WRITE
+                    if new_events != events:
+                        events = new_events
+                        selector.modify(self.socket, events, 'socket')
+                    for key, mask in selector.select():
+                        if key.data == 'queue':
+                            self._queue.clear_wakeup()
+                        elif key.data == 'socket':
+                            if mask & selectors.EVENT_WRITE:
+                                self.flush()
+                            if mask & selectors.EVENT_READ:
+                                requests = self.recv_pdus()
+                                if requests is None:
+                                    logger.error("Empty PDU, connection closed!")
+                                    raise socket.error
+
+                for request in requests:
+                    response = self._dispatch(request)
+                    if response:
+                        self.send_pdu(response)
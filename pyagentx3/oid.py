@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.oid')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import struct
+import functools
+from pyagentx3.tools import oid_to_tuple
+
+
+# Max. number of different OIDs kept interned
+OID_CACHE_SIZE = 262144
+
+# AgentX OID header: n_subid, prefix, include, reserved
+_OID_HDR = struct.Struct('!BBBB')
+_INTERNET = (1, 3, 6, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def _subids_struct(n_subid):
+    # n_subid is a single octet, so at most 256 different structures
+    return struct.Struct('!%dL' % n_subid)
+
+
+class OID(str):
+
+    # Object identifier. Still the dotted string, so it can be used
+    # wherever the string form was used before, but it also keeps the
+    # tuple of sub-identifiers and its AgentX encoding. Comparison is by
+    # sub-identifiers. Instances are interned, creating an OID seen before
+    # is a cache lookup without any parsing.
+
+    def __new__(cls, oid=''):
+        if isinstance(oid, OID):
+            return oid
+        if isinstance(oid, (tuple, list)):
+            return _from_subids(tuple(oid))
+        return _from_str(oid)
+
+    @classmethod
+    def _create(cls, subids):
+        self = str.__new__(cls, '.'.join([str(i) for i in subids]))
+        self.subids = subids
+        self._encoded = [None, None]
+        return self
+
+    @classmethod
+    def from_bytes(cls, buf, pos=0):
+        # Decode an AgentX encoded OID at pos of buf, returns the OID, its
+        # include flag and the position after it.
+        n_subid, prefix, include, _ = _OID_HDR.unpack_from(buf, pos)
+        pos += _OID_HDR.size
+        subids = ()
+        if n_subid:
+            subids = _subids_struct(n_subid).unpack_from(buf, pos)
+            pos += 4 * n_subid
+        if prefix:
+            subids = _INTERNET + (prefix,) + subids
+        return _from_subids(subids), include, pos
+
+    def encoded(self, include=0):
+        # AgentX encoding, computed once
+        include = 1 if include else 0
+        buf = self._encoded[include]
+        if buf is None:
+            subids = self.subids
+            prefix = 0
+            if (len(subids) > 5 and subids[:4] == _INTERNET and
+                    0 < subids[4] < 256):
+                prefix = subids[4]
+                subids = subids[5:]
+            buf = (_OID_HDR.pack(len(subids), prefix, include, 0) +
+                _subids_struct(len(subids)).pack(*subids))
+            self._encoded[include] = buf
+        return buf
+
+    def in_subtree(self, root):
+        # True if root is a prefix of (or equal to) this OID, only whole
+        # sub-identifiers match
+        root = _subids(root)
+        return self.subids[:len(root)] == root
+
+    def __lt__(self, other):
+        return self.subids < _subids(other)
+
+    def __le__(self, other):
+        return self.subids <= _subids(other)
+
+    def __gt__(self, other):
+        return self.subids > _subids(other)
+
+    def __ge__(self, other):
+        return self.subids >= _subids(other)
+
+    def __reduce__(self):
+        return OID, (str(self),)
+
+
+def _subids(oid):
+    if isinstance(oid, OID):
+        return oid.subids
+    if isinstance(oid, tuple):
+        return oid
+    return OID(oid).subids
+
+@functools.lru_cache(maxsize=OID_CACHE_SIZE)
+def _from_subids(subids):
+    return OID._create(subids)
+
+@functools.lru_cache(maxsize=OID_CACHE_SIZE)
+def _from_str(oid):
+    return _from_subids(oid_to_tuple(oid))
@@ -10,11 +10,29 @@ logger.addHandler(NullHandler())
 # --------------------------------------------
 
 import struct
+import functools
 from ipaddress import IPv4Address, IPv6Address
 import collections
 import pprint
 import pyagentx3
 from pyagentx3.tools import hexdump
+from pyagentx3.oid import OID, OID_CACHE_SIZE, _OID_HDR
+
+
+# Pre-compiled structures used by the encoder and decoder
+_HEADER = struct.Struct('!BBBBLLLL')
+_VALUE_HDR = struct.Struct('!HH')
+_RESPONSE_HDR = struct.Struct('!LHH')
+_BULK_HDR = struct.Struct('!HH')
+_INT32 = struct.Struct('!l')
+_UINT32 = struct.Struct('!L')
+_UINT64 = struct.Struct('!Q')
+_EMPTY = memoryview(b'')
+_PADDING = [b'', b'\x00', b'\x00\x00', b'\x00\x00\x00']
+
+@functools.lru_cache(maxsize=OID_CACHE_SIZE)
+def _encode_varbind_header(pdu_type, name):
+    return _VALUE_HDR.pack(pdu_type, 0) + PDU.encode_oid(name)
 
 
 class PDU(object):
@@ -25,14 +43,22 @@ class PDU(object):
         self.session_id = 0
         self.transaction_id = 0
         self.packet_id = 0
+        # REGISTER only: if range_subid is set the sub-identifier at this
+        # (1 based) position of oid ranges up to upper_bound
+        self.range_subid = 0
+        self.upper_bound = 0
         self.error = pyagentx3.ERROR_NOAGENTXERROR
         self.error_index = 0
-        self.decode_buf = ''
+        self.decode_buf = _EMPTY
+        self.decode_pos = 0
         self.state = {}
         self.values = []
 
     def dump(self, force=False):
         log_level = logging.INFO if force else logging.DEBUG
+        # Formatting the values is expensive, skip it if nobody listens
+        if not logger.isEnabledFor(log_level):
+            return
         name = pyagentx3.PDU_TYPE_NAME[self.type]
         logger.log(log_level, 'PDU DUMP: New PDU')
         logger.log(log_level, 'PDU DUMP: Meta      : [%s: %d %d %d]',
@@ -49,30 +75,23 @@ class PDU(object):
         if hasattr(self, 'values'):
             logger.log(log_level, 'PDU DUMP: Values    : %s', pprint.pformat(self.values))
 
+        if hasattr(self, 'non_repeaters'):
+            logger.log(log_level, 'PDU DUMP: Bulk      : non_repeaters %d max_repetitions %d',
+                                                self.non_repeaters,
+                                                self.max_repetitions)
+
         if hasattr(self, 'range_list'):
             logger.log(log_level, 'PDU DUMP: Range list: %s', pprint.pformat(self.range_list))
 
     # ====================================================
     # encode functions
 
-    def encode_oid(self, oid, include=0):
-        oid = oid.strip()
-        oid = oid.split('.')
-        oid = [int(i) for i in oid]
-        if len(oid) > 5 and oid[:4] == [1, 3, 6, 1]:
-            # prefix
-            prefix = oid[4]
-            oid = oid[5:]
-        else:
-            # no prefix
-            prefix = 0
-        buf = struct.pack('BBBB', len(oid), prefix, include, 0)
-        for i in range(len(oid)):
-            buf += struct.pack('!L', oid[i])
-        return buf
+    @staticmethod
+    def encode_oid(oid, include=0):
+        return OID(oid).encoded(include)
 
-    def encode_octet(self, octet):
-        data_len = 0
+    @staticmethod
+    def encode_octet(octet):
         data = octet
 
         if not isinstance(octet, collections.abc.Sized):
@@ -85,36 +104,33 @@ class PDU(object):
             data = data.encode('latin1')
 
         data_len = len(data)
-        buf = struct.pack('!L', data_len)
-
-        buf += bytearray(data)
-
         padding = -data_len % 4
-        buf += bytearray([0] * padding)
-        return buf
+        return b''.join((_UINT32.pack(data_len), bytes(data), _PADDING[padding]))
 
-    def encode_value(self, pdu_type, name, value):
-        buf = struct.pack('!HH', pdu_type, 0)
-        buf += self.encode_oid(name)
+    @staticmethod
+    def encode_value(pdu_type, name, value):
+        # Type and name of a varbind only depend on the served OID, so
+        # they are encoded once and then taken from the cache.
+        buf = _encode_varbind_header(pdu_type, name)
 
         if pdu_type in [pyagentx3.TYPE_INTEGER]:
-            buf += struct.pack('!l', value)
+            return buf + _INT32.pack(value)
 
         elif pdu_type in [pyagentx3.TYPE_COUNTER32,
                           pyagentx3.TYPE_GAUGE32,
                           pyagentx3.TYPE_TIMETICKS]:
-            buf += struct.pack('!L', value)
+            return buf + _UINT32.pack(value)
 
         elif pdu_type in [pyagentx3.TYPE_COUNTER64]:
-            buf += struct.pack('!Q', value)
+            return buf + _UINT64.pack(value)
 
         elif pdu_type in [pyagentx3.TYPE_OBJECTIDENTIFIER]:
-            buf += self.encode_oid(value)
+            return buf + PDU.encode_oid(value)
 
         elif pdu_type in [pyagentx3.TYPE_IPADDRESS,
                           pyagentx3.TYPE_OPAQUE,
                           pyagentx3.TYPE_OCTETSTRING]:
-            buf += self.encode_octet(value)
+            return buf + PDU.encode_octet(value)
 
         elif pdu_type in [pyagentx3.TYPE_NULL,
                           pyagentx3.TYPE_NOSUCHOBJECT,
@@ -126,88 +142,89 @@ class PDU(object):
             logger.error('Unknown Type: %s', pdu_type)
         return buf
 
+    def encode_values(self, parts):
+        for value in self.values:
+            varbind = value.get('varbind')
+            if varbind is None:
+                varbind = self.encode_value(value['type'], value['name'], value['value'])
+            parts.append(varbind)
+
     def encode_header(self, pdu_type, payload_length=0, flags=0):
         flags = flags | pyagentx3.AX_PDU_FLAG_BYTE_ORDER # Bit 5 = all ints in NETWORK_BYTE_ORDER
-        buf = struct.pack('BBBB', 1, pdu_type, flags, 0)
-        buf += struct.pack('!L', self.session_id) # sessionID
-        buf += struct.pack('!L', self.transaction_id) # transactionID
-        buf += struct.pack('!L', self.packet_id) # packetID
-        buf += struct.pack('!L', payload_length)
-        return buf
+        return _HEADER.pack(1, pdu_type, flags, 0,
+            self.session_id, self.transaction_id, self.packet_id,
+            payload_length)
 
     def encode(self):
-        buf = b''
+        # Collect all parts of the payload and join them once at the end
+        parts = []
         if self.type == pyagentx3.AGENTX_OPEN_PDU:
             # timeout
-            buf += struct.pack('!BBBB', 5, 0, 0, 0)
+            parts.append(_OID_HDR.pack(5, 0, 0, 0))
             # agent OID
-            buf += struct.pack('!L', 0)
+            parts.append(_UINT32.pack(0))
             # Agent Desc
-            buf += self.encode_octet(self.agent_id)
+            parts.append(self.encode_octet(self.agent_id))
 
         elif self.type == pyagentx3.AGENTX_PING_PDU:
             # No extra data
             pass
 
         elif self.type == pyagentx3.AGENTX_REGISTER_PDU:
-            range_subid = 0
             timeout = 5
             priority = 127
-            buf += struct.pack('BBBB', timeout, priority, range_subid, 0)
+            parts.append(_OID_HDR.pack(timeout, priority, self.range_subid, 0))
             # Sub Tree
-            buf += self.encode_oid(self.oid)
+            parts.append(self.encode_oid(self.oid))
+            if self.range_subid:
+                parts.append(_UINT32.pack(self.upper_bound))
 
         elif self.type == pyagentx3.AGENTX_RESPONSE_PDU:
-            buf += struct.pack('!LHH', 0, self.error, self.error_index)
-            for value in self.values:
-                buf += self.encode_value(value['type'], value['name'], value['value'])
+            parts.append(_RESPONSE_HDR.pack(0, self.error, self.error_index))
+            self.encode_values(parts)
 
         elif self.type == pyagentx3.AGENTX_NOTIFY_PDU:
-            for value in self.values:
-                buf += self.encode_value(value['type'], value['name'], value['value'])
+            self.encode_values(parts)
 
         else:
             # Unsupported PDU type
             pass
 
-        encoded_pdu = self.encode_header(self.type, len(buf)) + buf
+        payload_length = sum(len(part) for part in parts)
+        parts.insert(0, self.encode_header(self.type, payload_length))
+        encoded_pdu = b''.join(parts)
 
-        logger.debug('Encoded AgentX PDU:')
-        for i in hexdump(encoded_pdu, sep='-'):
-            logger.debug(i)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Encoded AgentX PDU:')
+            for i in hexdump(encoded_pdu, sep='-'):
+                logger.debug(i)
 
         return encoded_pdu
 
 
     # ====================================================
     # decode functions
+    #
+    # Decoding walks a single memoryview of the received PDU with an
+    # offset (decode_pos), no partial copies of the buffer are made.
 
     def set_decode_buf(self, buf):
-        self.decode_buf = buf
+        self.decode_buf = memoryview(buf)
+        self.decode_pos = 0
+
+    def decode_remaining(self):
+        return len(self.decode_buf) - self.decode_pos
 
     def decode_oid(self):
         try:
-            t = struct.unpack('!BBBB', self.decode_buf[:4])
-            self.decode_buf = self.decode_buf[4:]
-            ret = {
-                'n_subid': t[0],
-                'prefix':t[1],
-                'include':t[2],
-                'reserved':t[3],
-            }
-            sub_ids = []
-            if ret['prefix']:
-                sub_ids = [1, 3, 6, 1]
-                sub_ids.append(ret['prefix'])
-            for i in range(ret['n_subid']):
-                t = struct.unpack('!L', self.decode_buf[:4])
-                self.decode_buf = self.decode_buf[4:]
-                sub_ids.append(t[0])
-            oid = '.'.join(str(i) for i in sub_ids)
-            return oid, ret['include']
+            # Interned OID, no string parsing
+            oid, include, self.decode_pos = OID.from_bytes(self.decode_buf,
+                self.decode_pos)
+            return oid, include
         except Exception:
             logger.exception('Invalid packing OID header')
-            logger.debug('%s', pprint.pformat(self.decode_buf))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s', pprint.pformat(bytes(self.decode_buf[self.decode_pos:])))
 
     def decode_search_range(self):
         start_oid, include = self.decode_oid()
@@ -218,20 +235,22 @@ class PDU(object):
 
     def decode_search_range_list(self):
         range_list = []
-        while len(self.decode_buf):
+        while self.decode_remaining() > 0:
             range_list.append(self.decode_search_range())
         return range_list
 
     def decode_octet(self):
         try:
-            t = struct.unpack('!L', self.decode_buf[:4])
+            t = _UINT32.unpack_from(self.decode_buf, self.decode_pos)
             l = t[0]
             buf = b''
-            self.decode_buf = self.decode_buf[4:]
+            self.decode_pos += _UINT32.size
             if l > 0:
+                if l > self.decode_remaining():
+                    raise ValueError('Octet string exceeds PDU')
                 padding = -l % 4
-                buf = self.decode_buf[:l]
-                self.decode_buf = self.decode_buf[l+padding:]
+                buf = bytes(self.decode_buf[self.decode_pos:self.decode_pos+l])
+                self.decode_pos += l + padding
             return buf
         except Exception:
             logger.exception('Invalid packing octet header')
@@ -243,8 +262,8 @@ class PDU(object):
         data = None
 
         try:
-            vtype, _ = struct.unpack('!HH', self.decode_buf[:4])
-            self.decode_buf = self.decode_buf[4:]
+            vtype, _ = _VALUE_HDR.unpack_from(self.decode_buf, self.decode_pos)
+            self.decode_pos += _VALUE_HDR.size
         except Exception:
             logger.exception('Unable to unpack value header')
             ok = False
@@ -263,14 +282,14 @@ class PDU(object):
                             pyagentx3.TYPE_COUNTER32,
                             pyagentx3.TYPE_GAUGE32,
                             pyagentx3.TYPE_TIMETICKS]:
-                    data = struct.unpack('!L', self.decode_buf[:4])
+                    data = _UINT32.unpack_from(self.decode_buf, self.decode_pos)
                     data = data[0]
-                    self.decode_buf = self.decode_buf[4:]
+                    self.decode_pos += _UINT32.size
 
                 elif vtype in [pyagentx3.TYPE_COUNTER64]:
-                    data = struct.unpack('!Q', self.decode_buf[:8])
+                    data = _UINT64.unpack_from(self.decode_buf, self.decode_pos)
                     data = data[0]
-                    self.decode_buf = self.decode_buf[8:]
+                    self.decode_pos += _UINT64.size
 
                 elif vtype in [pyagentx3.TYPE_OBJECTIDENTIFIER]:
                     data, _ = self.decode_oid()
@@ -298,10 +317,21 @@ class PDU(object):
 
         return {'type':vtype, 'name':oid, 'data':data}, ok
 
+    def decode_varbind_list(self):
+        values = []
+        while self.decode_remaining() > 0:
+            data, ok = self.decode_value()
+            if not ok:
+                # Position in buffer is undefined after a failed value,
+                # skip rest of the list.
+                break
+            values.append(data)
+        return values
+
     @staticmethod
     def decode_header(buf):
         try:
-            t = struct.unpack('!BBBBLLLL', buf[:pyagentx3.AX_PDU_HDR_LEN])
+            t = _HEADER.unpack_from(buf)
             ret = {
                 'version': t[0],
                 'pdu_type':t[1],
@@ -320,38 +350,55 @@ class PDU(object):
     def _decode_header(self):
         try:
             ret = self.__class__.decode_header(self.decode_buf)
-            self.decode_buf = self.decode_buf[pyagentx3.AX_PDU_HDR_LEN:]
             if not isinstance(ret, dict):
                 raise Exception("Invalid PDU header")
+            self.decode_pos = pyagentx3.AX_PDU_HDR_LEN
 
             self.state = ret
             self.type = ret['pdu_type']
             self.session_id = ret['session_id']
             self.packet_id = ret['packet_id']
             self.transaction_id = ret['transaction_id']
-            self.decode_buf = self.decode_buf[:ret['payload_length']]
+            # Limit view to this PDU (zero-copy)
+            self.decode_buf = self.decode_buf[:pyagentx3.AX_PDU_HDR_LEN +
+                ret['payload_length']]
             if ret['flags'] & pyagentx3.AX_PDU_FLAG_CONTEXT:  # content present
                 context = self.decode_octet()
                 logger.debug('Context: %s', context)
             return ret
         except Exception:
             logger.exception('Invalid packing: %d', len(self.decode_buf))
-            logger.debug('%s', pprint.pformat(self.decode_buf))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s', pprint.pformat(bytes(self.decode_buf)))
 
     def decode(self, buf):
         self.set_decode_buf(buf)
-
-        logger.debug('Decode AgentX PDU:')
-        for i in hexdump(self.decode_buf, sep='-'):
-            logger.debug(i)
+        try:
+            self._decode()
+        except Exception:
+            # Malformed payload, never raised to the network loop. The
+            # request is answered with a parseError.
+            logger.exception('Invalid PDU payload')
+            self.error = pyagentx3.ERROR_PARSEERROR
+        finally:
+            # Don't keep a reference to the (possibly shared) buffer
+            self.decode_buf = _EMPTY
+            self.decode_pos = 0
+
+    def _decode(self):
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Decode AgentX PDU:')
+            for i in hexdump(self.decode_buf, sep='-'):
+                logger.debug(i)
 
         ret = self._decode_header()
         if not isinstance(ret, dict):
             return
         if ret['pdu_type'] == pyagentx3.AGENTX_RESPONSE_PDU:
             # Decode Response Header
-            t = struct.unpack('!LHH', self.decode_buf[:8])
-            self.decode_buf = self.decode_buf[8:]
+            t = _RESPONSE_HDR.unpack_from(self.decode_buf, self.decode_pos)
+            self.decode_pos += _RESPONSE_HDR.size
             self.response = {
                 'sysUpTime': t[0],
                 'error':t[1],
@@ -359,11 +406,7 @@ class PDU(object):
                 'index':t[2],
             }
             # Decode VarBindList
-            self.values = []
-            while len(self.decode_buf):
-                data, ok = self.decode_value()
-                if ok:
-                    self.values.append(data)
+            self.values = self.decode_varbind_list()
 
         elif ret['pdu_type'] == pyagentx3.AGENTX_GET_PDU:
             self.range_list = self.decode_search_range_list()
@@ -371,19 +414,54 @@ class PDU(object):
         elif ret['pdu_type'] == pyagentx3.AGENTX_GETNEXT_PDU:
             self.range_list = self.decode_search_range_list()
 
+        elif ret['pdu_type'] == pyagentx3.AGENTX_GETBULK_PDU:
+            t = _BULK_HDR.unpack_from(self.decode_buf, self.decode_pos)
+            self.decode_pos += _BULK_HDR.size
+            self.non_repeaters = t[0]
+            self.max_repetitions = t[1]
+            self.range_list = self.decode_search_range_list()
+
         elif ret['pdu_type'] == pyagentx3.AGENTX_TESTSET_PDU:
             # Decode VarBindList
-            self.values = []
-            while len(self.decode_buf):
-                data, ok = self.decode_value()
-                if ok:
-                    self.values.append(data)
+            self.values = self.decode_varbind_list()
 
         elif ret['pdu_type'] in [pyagentx3.AGENTX_COMMITSET_PDU,
                                  pyagentx3.AGENTX_UNDOSET_PDU,
-                                 pyagentx3.AGENTX_CLEANUPSET_PDU]:
+                                 pyagentx3.AGENTX_CLEANUPSET_PDU,
+                                 pyagentx3.AGENTX_PING_PDU]:
             pass
 
+        # PDUs sent by a subagent, only decoded to look at captures
+
+        elif ret['pdu_type'] == pyagentx3.AGENTX_OPEN_PDU:
+            t = _OID_HDR.unpack_from(self.decode_buf, self.decode_pos)
+            self.decode_pos += _OID_HDR.size
+            self.timeout = t[0]
+            self.oid, _ = self.decode_oid()
+            self.agent_id = self.decode_octet().decode('utf-8', 'replace')
+
+        elif ret['pdu_type'] == pyagentx3.AGENTX_CLOSE_PDU:
+            self.reason = _OID_HDR.unpack_from(self.decode_buf,
+                self.decode_pos)[0]
+            self.decode_pos += _OID_HDR.size
+
+        elif ret['pdu_type'] in [pyagentx3.AGENTX_REGISTER_PDU,
+                                 pyagentx3.AGENTX_UNREGISTER_PDU]:
+            t = _OID_HDR.unpack_from(self.decode_buf, self.decode_pos)
+            self.decode_pos += _OID_HDR.size
+            self.timeout = t[0]
+            self.priority = t[1]
+            self.range_subid = t[2]
+            self.oid, _ = self.decode_oid()
+            if self.range_subid:
+                self.upper_bound = _UINT32.unpack_from(self.decode_buf,
+                    self.decode_pos)[0]
+                self.decode_pos += _UINT32.size
+
+        elif ret['pdu_type'] == pyagentx3.AGENTX_NOTIFY_PDU:
+            # Decode VarBindList
+            self.values = self.decode_varbind_list()
+
         else:
             pdu_type_str = pyagentx3.PDU_TYPE_NAME.get(ret['pdu_type'],
                 'Unknown:'+ str(ret['pdu_type']))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.provider')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from pyagentx3.oid import OID
+from pyagentx3.tools import oid_to_tuple
+from pyagentx3.varbind import VarBind
+
+
+class Provider():
+
+    # Values of a subtree collected on demand instead of periodically by
+    # an updater. get() is only called when a request hits the subtree and
+    # its result is cached for ttl seconds, at most cache_size values are
+    # kept. Callbacks run in the network thread (or event loop), so they
+    # should return quickly.
+
+    ttl = 10
+    cache_size = 1024
+
+    def __init__(self, data_store=None):
+        self.data_store = data_store
+
+    # User override these
+    def get(self, oid):
+        # (type, value) of the relative oid, None if it doesn't exist
+        return None
+
+    def oids(self):
+        # Relative OIDs of the subtree, needed for GETNEXT and walks.
+        # Cached for ttl seconds as well.
+        return []
+
+    def ttl_for(self, oid):
+        # Override for a per OID cache time
+        return self.ttl
+
+
+class ProviderSegment():
+
+    # MIB segment calling a provider, keeps the LRU cache of its values
+
+    def __init__(self, oid, provider):
+        self.oid = oid
+        self.key = oid_to_tuple(oid)
+        self.provider = provider
+        self._cache = OrderedDict()
+        self._keys = []
+        self._keys_expire = None
+
+    def _lookup(self, suffix):
+        now = time.monotonic()
+        entry = self._cache.get(suffix)
+        if entry is not None and entry[0] > now:
+            self._cache.move_to_end(suffix)
+            return entry[1]
+        oid = '.'.join(str(i) for i in suffix)
+        row = None
+        try:
+            result = self.provider.get(oid)
+            if result is not None:
+                type_, value = result
+                row = VarBind(OID(self.key + suffix), type_, value)
+            expire = now + self.provider.ttl_for(oid)
+        except Exception:
+            logger.exception('Unhandled provider exception')
+            return None
+        # Missing values are cached too
+        self._cache[suffix] = (expire, row)
+        self._cache.move_to_end(suffix)
+        if len(self._cache) > self.provider.cache_size:
+            self._cache.popitem(last=False)
+        return row
+
+    def _sorted_keys(self):
+        now = time.monotonic()
+        if self._keys_expire is None or self._keys_expire <= now:
+            try:
+                self._keys = sorted(oid_to_tuple(oid)
+                    for oid in self.provider.oids())
+            except Exception:
+                logger.exception('Unhandled provider exception')
+            self._keys_expire = now + self.provider.ttl
+        return self._keys
+
+    def get(self, key):
+        if key[:len(self.key)] != self.key or len(key) == len(self.key):
+            return None
+        return self._lookup(key[len(self.key):])
+
+    def get_next(self, start, include=0):
+        head = start[:len(self.key)]
+        if head > self.key:
+            # start is behind this subtree
+            return None, None
+        keys = self._sorted_keys()
+        pos = 0
+        if head == self.key:
+            suffix = start[len(self.key):]
+            if include:
+                pos = bisect_left(keys, suffix)
+            else:
+                pos = bisect_right(keys, suffix)
+        # Skip OIDs the provider has no value for
+        while pos < len(keys):
+            row = self._lookup(keys[pos])
+            if row is not None:
+                return self.key + keys[pos], row
+            pos += 1
+        return None, None
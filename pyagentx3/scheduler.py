@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.scheduler')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import time
+import heapq
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pyagentx3.tools import WakeupEvent
+
+
+# Default number of threads running update() calls
+UPDATE_WORKERS = 4
+
+
+def _process_context():
+    # Workers are started while the network and scheduler threads run. A
+    # forked child could inherit a lock held by one of them (e.g. a
+    # logging lock) and deadlock, so they are started from a fresh
+    # process instead. Updater classes must be importable for that.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class Scheduler(threading.Thread):
+
+    # Runs the update cycles of all updaters from a single thread. Due
+    # updaters are kept in a heap ordered by the monotonic clock and run
+    # on a bounded pool of worker threads, so the number of threads does
+    # not depend on the number of registered updaters. Updaters added with
+    # process=True run their update() in a pool of worker processes.
+
+    def __init__(self, workers=UPDATE_WORKERS, process_workers=None):
+        threading.Thread.__init__(self, name='pyagentx3-scheduler')
+        self.stop = WakeupEvent(self)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+            thread_name_prefix='pyagentx3-updater')
+        self._process_workers = process_workers
+        self._process_executor = None
+
+    def add(self, updater, process=False):
+        if process and self._process_executor is None:
+            self._process_executor = ProcessPoolExecutor(
+                max_workers=self._process_workers,
+                mp_context=_process_context())
+        # Updater is due immediately
+        self._schedule(updater, process, time.monotonic())
+
+    def _schedule(self, updater, process, due):
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), updater, process))
+            self._cond.notify()
+
+    def wakeup(self):
+        with self._cond:
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                # Checked under the lock, stop.set() notifies with it held,
+                # so the wakeup can't get lost before wait()
+                if self.stop.is_set():
+                    break
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due = self._heap[0][0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, updater, process = heapq.heappop(self._heap)
+            self._executor.submit(self._run_updater, updater, process, due)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._process_executor is not None:
+            self._process_executor.shutdown(wait=False, cancel_futures=True)
+        logger.info('Scheduler stopping')
+
+    def _run_updater(self, updater, process, due):
+        try:
+            if process:
+                updater.run_once_in_process(self._process_executor)
+            else:
+                updater.run_once()
+        finally:
+            # Rescheduled only after the cycle finished, so an updater
+            # never runs concurrently with itself. A late updater runs
+            # again right away but doesn't catch up on missed cycles.
+            now = time.monotonic()
+            due += updater._freq
+            if due < now:
+                due = now
+            if not self.stop.is_set():
+                self._schedule(updater, process, due)
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.session')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import itertools
+import functools
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import pyagentx3
+from pyagentx3.pdu import PDU
+from pyagentx3.mib import MIB
+from pyagentx3.oid import OID
+from pyagentx3.tools import oid_to_tuple
+from pyagentx3.trie import OIDTrie
+
+
+# Max. number of REGISTER PDUs sent before waiting for their responses
+REGISTER_WINDOW = 64
+
+
+class ResponseError(Exception):
+
+    # Error response of the master to one of our PDUs
+
+    def __init__(self, pdu):
+        super().__init__(pdu.response['error_name'])
+        self.pdu = pdu
+        self.error = pdu.response['error']
+
+
+def registration_ranges(oid_list):
+    # Coalesce subtrees only differing in their last sub-identifier, with
+    # consecutive values, into one range registration (RFC 2741 section
+    # 6.2.3). Returns a list of (oid, range_subid, upper_bound, oids),
+    # oids are the registered subtrees covered by the range.
+    ranges = []
+    for key in sorted(set(oid_to_tuple(oid) for oid in oid_list)):
+        if ranges:
+            first, last, keys = ranges[-1]
+            if (len(key) == len(first) and key[:-1] == first[:-1] and
+                    key[-1] == last + 1):
+                keys.append(key)
+                ranges[-1] = first, key[-1], keys
+                continue
+        ranges.append((key, key[-1], [key]))
+    return [(OID(first),
+             len(first) if last != first[-1] else 0,
+             last if last != first[-1] else 0,
+             [OID(key) for key in keys])
+            for first, last, keys in ranges]
+
+
+class Session():
+
+    # AgentX protocol state and request processing of a subagent session,
+    # independent of how PDUs are transported. Used by the threaded
+    # Network and the asyncio based AsyncNetwork.
+
+    def __init__(self, oid_list, sethandlers, agent_id, consistent_walks=False):
+        self._agent_id = agent_id
+        self._oid_list = oid_list
+        self._sethandlers = sethandlers
+        # SetHandler of a value is the one with the longest matching OID
+        self._sethandler_trie = OIDTrie()
+        for oid, handler in sethandlers.items():
+            self._sethandler_trie[oid_to_tuple(oid)] = handler
+        # SetHandlers taking part in a SET transaction, by (session_id,
+        # transaction_id)
+        self._set_transactions = {}
+
+        self.session_id = 0
+        self.transaction_id = 0
+        self._packet_ids = itertools.count(1)
+        # Our PDUs waiting for a response, {packet_id: (pdu, future)}
+        self._pending = {}
+        self._register_queue = deque()
+        self._registering = 0
+        # Called with (oid, error) once the master answered a registration
+        self.on_register = None
+        # Dump sent and received PDUs, off unless debug logging is enabled
+        # (e.g. with pyagentx3.setup_logging(debug=True)) beforehand
+        self.debug = logger.isEnabledFor(logging.DEBUG)
+        # Capture recording the raw PDUs, see pyagentx3.capture
+        self.capture = None
+        # Data Related Variables
+        self.mib = MIB(consistent_walks)
+
+    def new_pdu(self, pdu_type):
+        pdu = PDU(pdu_type, agent_id=self._agent_id)
+        pdu.session_id = self.session_id
+        pdu.transaction_id = self.transaction_id
+        self.transaction_id += 1
+        # Responses are matched to their request by packet_id
+        pdu.packet_id = next(self._packet_ids) & 0xffffffff
+        return pdu
+
+    def response_pdu(self, org_pdu):
+        pdu = PDU(pyagentx3.AGENTX_RESPONSE_PDU, agent_id=self._agent_id)
+        pdu.session_id = org_pdu.session_id
+        pdu.transaction_id = org_pdu.transaction_id
+        pdu.packet_id = org_pdu.packet_id
+        return pdu
+
+    def register_pdus(self):
+        # List of (pdu, oids), oids are the registered subtrees the
+        # REGISTER PDU covers
+        pdus = []
+        for oid, range_subid, upper_bound, oids in registration_ranges(
+                self._oid_list):
+            pdu = self.new_pdu(pyagentx3.AGENTX_REGISTER_PDU)
+            pdu.oid = oid
+            pdu.range_subid = range_subid
+            pdu.upper_bound = upper_bound
+            pdus.append((pdu, oids))
+        return pdus
+
+    def send_request(self, pdu, future=None):
+        # Send a PDU the master answers with a RESPONSE PDU. The returned
+        # future is resolved with the response, or fails with a
+        # ResponseError if the master reported an error.
+        if future is None:
+            future = Future()
+        self._pending[pdu.packet_id] = pdu, future
+        self.send_pdu(pdu)
+        return future
+
+    def _process_response(self, pdu):
+        entry = self._pending.pop(pdu.packet_id, None)
+        if entry is None:
+            logger.debug("Response to unknown packet_id %d dropped",
+                pdu.packet_id)
+            return
+        _, future = entry
+        if not future.set_running_or_notify_cancel():
+            return
+        if pdu.response['error'] != pyagentx3.ERROR_NOAGENTXERROR:
+            future.set_exception(ResponseError(pdu))
+        else:
+            future.set_result(pdu)
+
+    def _fail_pending(self, error):
+        # Connection lost, no responses will arrive anymore
+        pending = list(self._pending.values())
+        self._pending.clear()
+        self._register_queue.clear()
+        self._registering = 0
+        for _, future in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def start_registration(self):
+        # Registrations are sent in the background, REGISTER_WINDOW at a
+        # time, while requests for already registered subtrees are served.
+        self._register_queue = deque(self.register_pdus())
+        self._send_registrations()
+
+    def _send_registrations(self):
+        while self._register_queue and self._registering < REGISTER_WINDOW:
+            pdu, oids = self._register_queue.popleft()
+            logger.info("Registering: %s", pdu.oid)
+            self._registering += 1
+            future = self.send_request(pdu)
+            future.add_done_callback(functools.partial(self._registered,
+                oids))
+
+    def _registered(self, oids, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, ResponseError):
+            logger.error("Registering %s failed: %s", ', '.join(oids), error)
+        elif error is not None:
+            # Connection lost, registered again after reconnect
+            return
+        self._registering -= 1
+        # Next window first, the user callback must not stop registration
+        self._send_registrations()
+        if self.on_register is None:
+            return
+        # Once for each registered subtree, also if several of them were
+        # registered as one range
+        for oid in oids:
+            try:
+                self.on_register(oid, error)
+            except Exception:
+                logger.exception('Unhandled registered() exception')
+
+    def _dispatch(self, pdu):
+        # Handle a received PDU, returns the response to send, if any.
+        # Responses to our own PDUs are never answered.
+        if pdu.error == pyagentx3.ERROR_PARSEERROR:
+            if pdu.type == pyagentx3.AGENTX_RESPONSE_PDU:
+                logger.error("Invalid response to packet_id %d dropped",
+                    pdu.packet_id)
+                return None
+            response = self.response_pdu(pdu)
+            response.error = pyagentx3.ERROR_PARSEERROR
+            return response
+        if pdu.type == pyagentx3.AGENTX_RESPONSE_PDU:
+            self._process_response(pdu)
+            return None
+        return self._process_request(pdu)
+
+    def _apply_update(self, item):
+        # Apply an item received from an updater, traps are sent right
+        # away.
+        #logger.info('Update: {}'.format(item))
+
+        if 'oid' in item:
+            #logger.info('New update')
+            # replace values of the updated subtree only
+            if 'segment' in item:
+                self.mib.replace(item['segment'])
+            elif 'changed' in item:
+                self.mib.apply_delta(item['oid'], item['changed'],
+                    item['removed'])
+            else:
+                self.mib.update(item['oid'], item['data'])
+
+        elif 'trap_oid' in item:
+            #logger.info('New traps')
+            trap_data = item['data']
+
+            if len(trap_data) > 0:
+                trap_pdu = self.new_pdu(pyagentx3.AGENTX_NOTIFY_PDU)
+                for row in list(trap_data.values()):
+                    #logger.info(row)
+                    trap_pdu.values.append(row)
+                trap_pdu.dump()
+                self.send_request(trap_pdu, item.get('future'))
+
+    def _process_request(self, request):
+        response = self.response_pdu(request)
+        if request.type == pyagentx3.AGENTX_GET_PDU:
+            logger.debug("Received GET PDU")
+            for rvalue in request.range_list:
+                oid = rvalue[0]
+                logger.debug("OID: %s", oid)
+                row = self.mib.get(oid)
+                if row:
+                    logger.debug("OID Found")
+                    response.values.append(row)
+                else:
+                    logger.debug("OID Not Found!")
+                    response.values.append({
+                        'type': pyagentx3.TYPE_NOSUCHOBJECT,
+                        'name': rvalue[0],
+                        'value': 0})
+
+        elif request.type == pyagentx3.AGENTX_GETNEXT_PDU:
+            logger.debug("Received GET_NEXT PDU")
+            for rvalue in request.range_list:
+                row = self.mib.get_next(rvalue[0], rvalue[1], rvalue[2])
+                logger.debug("GET_NEXT: %s => %s", rvalue[0],
+                    row['name'] if row else None)
+                if row:
+                    response.values.append(row)
+                else:
+                    response.values.append({
+                        'type': pyagentx3.TYPE_ENDOFMIBVIEW,
+                        'name': rvalue[0],
+                        'value': 0})
+
+        elif request.type == pyagentx3.AGENTX_GETBULK_PDU:
+            logger.debug("Received GET_BULK PDU")
+            non_repeaters = request.range_list[:request.non_repeaters]
+            repeaters = request.range_list[request.non_repeaters:]
+            for rvalue in non_repeaters:
+                row = self.mib.get_next(rvalue[0], rvalue[1], rvalue[2])
+                if row:
+                    response.values.append(row)
+                else:
+                    response.values.append({
+                        'type': pyagentx3.TYPE_ENDOFMIBVIEW,
+                        'name': rvalue[0],
+                        'value': 0})
+            # Each repeater walks the sorted index from its own search
+            # range, stop early once all of them reached its end.
+            walks = [self.mib.walk(rvalue[0], rvalue[1], rvalue[2])
+                for rvalue in repeaters]
+            last = [rvalue[0] for rvalue in repeaters]
+            for _ in range(request.max_repetitions):
+                done = True
+                for i, walk in enumerate(walks):
+                    row = next(walk, None)
+                    if row:
+                        done = False
+                        last[i] = row['name']
+                        response.values.append(row)
+                    else:
+                        response.values.append({
+                            'type': pyagentx3.TYPE_ENDOFMIBVIEW,
+                            'name': last[i],
+                            'value': 0})
+                if done:
+                    break
+            logger.debug("GET_BULK: %d values", len(response.values))
+
+        elif request.type == pyagentx3.AGENTX_TESTSET_PDU:
+            logger.debug("Received TESTSET PDU")
+            # Values per SetHandler, in request order
+            batches = OrderedDict()
+            for idx, row in enumerate(request.values, 1):
+                oid = row['name']
+                type_ = pyagentx3.TYPE_NAME.get(row['type'], 'Unknown type')
+                value = row['data']
+                logger.debug("Name: [%s] Type: [%s] Value: [%s]", oid, type_, value)
+                # Find matching sethandler
+                _, handler = self._sethandler_trie.longest_prefix(
+                    oid_to_tuple(oid))
+                if handler is None:
+                    logger.debug('TestSet request failed: not writeable #%s', idx)
+                    response.error = pyagentx3.ERROR_NOTWRITABLE
+                    response.error_index = idx
+                    break
+                batches.setdefault(handler, []).append((idx, oid, value))
+            else:
+                # Only these handlers take part in the following phases
+                involved = []
+                self._set_transactions[(request.session_id,
+                    request.transaction_id)] = involved
+                for handler, batch in batches.items():
+                    involved.append(handler)
+                    try:
+                        handler.network_test(request.session_id,
+                            request.transaction_id,
+                            [(oid, value) for _, oid, value in batch])
+                    except pyagentx3.SetHandlerError as e:
+                        idx = batch[0][0]
+                        for i, oid, _ in batch:
+                            if oid == getattr(e, 'oid', None):
+                                idx = i
+                                break
+                        logger.debug('TestSet request failed: wrong value #%s', idx)
+                        response.error = pyagentx3.ERROR_WRONGVALUE
+                        response.error_index = idx
+                        break
+                else:
+                    logger.debug('TestSet request passed')
+
+        elif request.type == pyagentx3.AGENTX_COMMITSET_PDU:
+            for handler in self._set_transactions.get((request.session_id,
+                    request.transaction_id), ()):
+                handler.network_commit(request.session_id, request.transaction_id)
+            logger.debug("Received COMMITSET PDU")
+
+        elif request.type == pyagentx3.AGENTX_UNDOSET_PDU:
+            for handler in self._set_transactions.get((request.session_id,
+                    request.transaction_id), ()):
+                handler.network_undo(request.session_id, request.transaction_id)
+            logger.debug("Received UNDOSET PDU")
+
+        elif request.type == pyagentx3.AGENTX_CLEANUPSET_PDU:
+            # Last phase of a transaction
+            for handler in self._set_transactions.pop((request.session_id,
+                    request.transaction_id), ()):
+                handler.network_cleanup(request.session_id, request.transaction_id)
+            logger.debug("Received CLEANUP PDU")
+
+        return response
@@ -11,52 +11,65 @@ logger.addHandler(NullHandler())
 
 
 class SetHandlerError(Exception):
-    pass
+
+    def __init__(self, *args, oid=None):
+        super().__init__(*args)
+        # OID of the rejected value, set by test_batch() if not given
+        self.oid = oid
 
 
 class SetHandler():
 
+    # Values of a SET request are passed as one batch of (oid, data) per
+    # handler. The network only calls the handlers taking part in a
+    # transaction, transactions are keyed by (session_id, transaction_id).
+
     def __init__(self, data_store=None):
         self.data_store = data_store
         self.transactions = {}
 
-    def network_test(self, session_id, transaction_id, oid, data):
-        tid = "%s_%s" % (session_id, transaction_id)
-        if tid in self.transactions:
-            del self.transactions[tid]
+    def network_test(self, session_id, transaction_id, values):
+        tid = (session_id, transaction_id)
+        self.transactions.pop(tid, None)
         try:
-            self.test(oid, data)
-            self.transactions[tid] = oid, data
+            self.test_batch(values)
+            self.transactions[tid] = values
         except SetHandlerError as e:
             logger.error('TestSet failed: %s', e)
             raise e
 
     def network_commit(self, session_id, transaction_id):
-        tid = "%s_%s" % (session_id, transaction_id)
-        if tid not in self.transactions:
+        values = self.transactions.pop((session_id, transaction_id), None)
+        if values is None:
             return
         try:
-            oid, data = self.transactions[tid]
-            self.commit(oid, data)
-            if tid in self.transactions:
-                del self.transactions[tid]
+            self.commit_batch(values)
         except Exception as e:
             logger.error('CommitSet failed: %s', e)
 
     def network_undo(self, session_id, transaction_id):
-        tid = "%s_%s" % (session_id, transaction_id)
-        if tid in self.transactions:
-            del self.transactions[tid]
+        self.transactions.pop((session_id, transaction_id), None)
 
     def network_cleanup(self, session_id, transaction_id):
-        tid = "%s_%s" % (session_id, transaction_id)
-        if tid in self.transactions:
-            del self.transactions[tid]
+        self.transactions.pop((session_id, transaction_id), None)
 
-    # User override these
+    # User override these, or the batch versions to handle all values
+    # of a request at once
     def test(self, oid, data):
         pass
 
     def commit(self, oid, data):
         pass
 
+    def test_batch(self, values):
+        for oid, data in values:
+            try:
+                self.test(oid, data)
+            except SetHandlerError as e:
+                if getattr(e, 'oid', None) is None:
+                    e.oid = oid
+                raise
+
+    def commit_batch(self, values):
+        for oid, data in values:
+            self.commit(oid, data)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.table')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+from bisect import bisect_left, bisect_right
+from ipaddress import IPv4Address
+import pyagentx3
+from pyagentx3.oid import OID
+from pyagentx3.tools import oid_to_tuple
+from pyagentx3.varbind import VarBind
+
+
+class TableError(Exception):
+    pass
+
+
+def encode_index(index_types, index, implied=False):
+    # Encode index values into sub-identifiers as described in RFC 2578
+    # section 7.7. If implied is set the last index has no length prefix.
+    if not isinstance(index, (tuple, list)):
+        index = (index,)
+    if len(index) != len(index_types):
+        raise TableError('Table has %d index values, got %d' % (
+            len(index_types), len(index)))
+    sub_ids = ()
+    last = len(index_types) - 1
+    for i, (type_, value) in enumerate(zip(index_types, index)):
+        try:
+            if type_ in [pyagentx3.TYPE_INTEGER,
+                         pyagentx3.TYPE_COUNTER32,
+                         pyagentx3.TYPE_GAUGE32,
+                         pyagentx3.TYPE_TIMETICKS]:
+                sub_ids += (int(value),)
+            elif type_ in [pyagentx3.TYPE_IPADDRESS]:
+                sub_ids += tuple(IPv4Address(value).packed)
+            elif type_ in [pyagentx3.TYPE_OCTETSTRING,
+                           pyagentx3.TYPE_OPAQUE]:
+                if isinstance(value, str):
+                    value = value.encode('latin1')
+                value = tuple(bytes(value))
+                if not (implied and i == last):
+                    value = (len(value),) + value
+                sub_ids += value
+            elif type_ in [pyagentx3.TYPE_OBJECTIDENTIFIER]:
+                value = oid_to_tuple(value)
+                if not (implied and i == last):
+                    value = (len(value),) + value
+                sub_ids += value
+            else:
+                raise TableError('Unsupported index type: %s' % type_)
+        except (TypeError, ValueError) as e:
+            raise TableError('Invalid index value %r: %s' % (value, e))
+    for sub_id in sub_ids:
+        # Index values are sent as 32 bit sub-identifiers, out of range
+        # values must fail here and not while encoding a response
+        if not 0 <= sub_id <= 0xffffffff:
+            raise TableError('Index sub-identifier out of range: %d' % sub_id)
+    return sub_ids
+
+
+class Table():
+
+    # Conceptual table of an updater, declared once with its columns
+    # ({column sub-identifier: type}) and index types. Cells are stored
+    # per column, rows are filled with add_row() or whole columns with
+    # set_column(). The entry OID is relative to the updater's subtree.
+
+    def __init__(self, oid, columns, index, implied=False):
+        self.oid = oid.strip(' .')
+        self.columns = dict(sorted(columns.items()))
+        for type_ in self.columns.values():
+            if type_ not in pyagentx3.TYPE_NAME:
+                raise TableError('Unknown column type: %s' % type_)
+        self.index = list(index)
+        self.implied = implied
+        self.clear()
+
+    def clear(self):
+        self._positions = {}
+        self._keys = []
+        self._cells = {column: [] for column in self.columns}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _position(self, index):
+        key = encode_index(self.index, index, self.implied)
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = len(self._keys)
+            self._positions[key] = pos
+            self._keys.append(key)
+            for cells in self._cells.values():
+                cells.append(None)
+        return pos
+
+    def add_row(self, index, *values):
+        # Values in column order, None leaves a cell empty
+        if len(values) > len(self.columns):
+            raise TableError('Table has %d columns, got %d values' % (
+                len(self.columns), len(values)))
+        pos = self._position(index)
+        for cells, value in zip(self._cells.values(), values):
+            cells[pos] = value
+
+    def set_column(self, column, values):
+        # values is a {index: value} mapping
+        if column not in self._cells:
+            raise TableError('Unknown column: %s' % column)
+        for index, value in values.items():
+            self._cells[column][self._position(index)] = value
+
+    def segment(self, oid):
+        # Immutable snapshot of the table for the MIB, oid is the
+        # updater's subtree. Only rows are sorted, not single cells.
+        order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+        keys = [self._keys[pos] for pos in order]
+        cells = {column: [values[pos] for pos in order]
+                 for column, values in self._cells.items()}
+        return TableSegment("%s.%s" % (oid, self.oid), self.columns, keys, cells)
+
+
+class TableSegment():
+
+    # MIB segment of a table, serves GET and GETNEXT in column-major order
+    # straight from the sorted row index.
+
+    def __init__(self, oid, columns, keys, cells):
+        self.oid = oid
+        self.key = oid_to_tuple(oid)
+        self.types = columns
+        self.column_ids = list(columns)
+        self.keys = keys
+        self.cells = cells
+
+    def _full(self, column, row):
+        # The name is built from the sub-identifiers, no string parsing
+        key = self.key + (column,) + self.keys[row]
+        return key, VarBind(OID(key), self.types[column],
+            self.cells[column][row])
+
+    def get(self, key):
+        if key[:len(self.key)] != self.key or len(key) < len(self.key) + 1:
+            return None
+        column = key[len(self.key)]
+        if column not in self.cells:
+            return None
+        index = key[len(self.key) + 1:]
+        row = bisect_left(self.keys, index)
+        if row < len(self.keys) and self.keys[row] == index:
+            if self.cells[column][row] is not None:
+                return self._full(column, row)[1]
+        return None
+
+    def get_next(self, start, include=0):
+        head = start[:len(self.key)]
+        if head > self.key:
+            # start is behind this table
+            return None, None
+        col_pos, row = 0, 0
+        if head == self.key and len(start) > len(self.key):
+            column = start[len(self.key)]
+            col_pos = bisect_left(self.column_ids, column)
+            if col_pos < len(self.column_ids) and self.column_ids[col_pos] == column:
+                index = start[len(self.key) + 1:]
+                if include:
+                    row = bisect_left(self.keys, index)
+                else:
+                    row = bisect_right(self.keys, index)
+        # Column-major: down the current column, then the next columns
+        while col_pos < len(self.column_ids):
+            cells = self.cells[self.column_ids[col_pos]]
+            while row < len(self.keys) and cells[row] is None:
+                row += 1
+            if row < len(self.keys):
+                return self._full(self.column_ids[col_pos], row)
+            col_pos += 1
+            row = 0
+        return None, None
@@ -9,9 +9,38 @@ logger = logging.getLogger('pyagentx3.tools')
 logger.addHandler(NullHandler())
 # --------------------------------------------
 
+import threading
 import pyagentx3
 
 
+def oid_to_tuple(oid):
+    # Convert a dotted OID string into a tuple of integer sub-identifiers
+    # which sorts in proper OID (lexicographic by sub-identifier) order.
+    # An OID instance already has it.
+    try:
+        return oid.subids
+    except AttributeError:
+        pass
+    oid = oid.strip(' .')
+    if not oid:
+        return ()
+    return tuple(int(i) for i in oid.split('.'))
+
+
+class WakeupEvent(threading.Event):
+
+    # Stop event which also wakes up a loop blocked on target by
+    # calling its wakeup() method.
+
+    def __init__(self, target):
+        super().__init__()
+        self._target = target
+
+    def set(self):
+        super().set()
+        self._target.wakeup()
+
+
 FMT = '{}  {}  |{}|'
 def hexdump(byte_string, length=16, base_addr=0, n=0, sep='-'):
     not_shown = ['  ']
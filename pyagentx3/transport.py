@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.transport')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+import socket
+
+
+# Default AgentX TCP port, see RFC 2741 section 8.1.1
+AGENTX_TCP_PORT = 705
+# TCP keepalive: idle seconds before the first probe, seconds between
+# probes and number of failed probes until the connection is dropped
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+class TransportError(Exception):
+    pass
+
+
+def parse_address(address):
+    # Parse a master address the way net-snmp accepts it: 'tcp:host:port',
+    # 'tcp:host', 'tcp:port' or 'tcp:[ipv6]:port' for TCP, 'unix:/path'
+    # or a plain path for a unix domain socket. Returns (family, address).
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    if not address.startswith('tcp:'):
+        return socket.AF_UNIX, address
+    family, host, port = socket.AF_INET, address[4:], AGENTX_TCP_PORT
+    if host.startswith('['):
+        family = socket.AF_INET6
+        host, _, rest = host[1:].partition(']')
+        if rest:
+            port = rest.lstrip(':')
+    elif ':' in host:
+        host, port = host.rsplit(':', 1)
+    elif host.isdigit():
+        # A single number is the port on the local host
+        host, port = '', host
+    try:
+        port = int(port)
+    except ValueError:
+        raise TransportError('Invalid port in address: %s' % address)
+    if not host:
+        host = '::1' if family == socket.AF_INET6 else 'localhost'
+    return family, (host, port)
+
+
+def configure_socket(sock, send_buffer=None):
+    # Tune a connected socket for small request/response PDUs
+    if send_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+    if sock.family == socket.AF_UNIX:
+        return
+    # Send responses immediately instead of waiting for more data
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Detect a vanished master even if it never sends anything
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in [('TCP_KEEPIDLE', KEEPALIVE_IDLE),
+                          ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                          ('TCP_KEEPCNT', KEEPALIVE_COUNT)]:
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def open_socket(address, send_buffer=None, timeout=None):
+    # Connect to the master, raises OSError if it isn't reachable
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+    else:
+        # Tries all addresses of host, IPv4 and IPv6
+        sock = socket.create_connection(address, timeout)
+    configure_socket(sock, send_buffer)
+    return sock
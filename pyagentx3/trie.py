@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.trie')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+
+_MISSING = object()
+
+
+class _Node():
+
+    __slots__ = ('children', 'value', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.value = _MISSING
+        # Number of values in the subtree of this node, itself included
+        self.count = 0
+
+
+class OIDTrie():
+
+    # Maps OIDs given as tuples of integer sub-identifiers to values. There
+    # is one node per sub-identifier, so lookups, prefix matches and
+    # subtree deletion take time proportional to the OID depth only, and
+    # prefixes always match at sub-identifier boundaries.
+
+    def __init__(self):
+        self._root = _Node()
+
+    def __len__(self):
+        return self._root.count
+
+    def _node(self, key):
+        node = self._root
+        for sub_id in key:
+            node = node.children.get(sub_id)
+            if node is None:
+                return None
+        return node
+
+    def __setitem__(self, key, value):
+        path = [self._root]
+        for sub_id in key:
+            node = path[-1].children.get(sub_id)
+            if node is None:
+                node = path[-1].children[sub_id] = _Node()
+            path.append(node)
+        if node.value is _MISSING:
+            for node in path:
+                node.count += 1
+        node.value = value
+
+    def get(self, key, default=None):
+        node = self._node(key)
+        if node is None or node.value is _MISSING:
+            return default
+        return node.value
+
+    def __contains__(self, key):
+        node = self._node(key)
+        return node is not None and node.value is not _MISSING
+
+    def prefixes(self, key):
+        # (length, value) of all entries which are a prefix of key (or key
+        # itself), the longest first
+        found = []
+        node = self._root
+        if node.value is not _MISSING:
+            found.append((0, node.value))
+        for i, sub_id in enumerate(key):
+            node = node.children.get(sub_id)
+            if node is None:
+                break
+            if node.value is not _MISSING:
+                found.append((i + 1, node.value))
+        return reversed(found)
+
+    def longest_prefix(self, key):
+        # (prefix, value) of the longest entry which is a prefix of key,
+        # (None, None) if there is none
+        for length, value in self.prefixes(key):
+            return key[:length], value
+        return None, None
+
+    def delete(self, key):
+        # Remove key and everything below it, returns the number of values
+        # removed
+        path = [self._root]
+        for sub_id in key:
+            node = path[-1].children.get(sub_id)
+            if node is None:
+                return 0
+            path.append(node)
+        removed = path[-1].count
+        if not key:
+            self._root = _Node()
+            return removed
+        for node in path[:-1]:
+            node.count -= removed
+        # Cut below the deepest ancestor still holding values, so no
+        # empty branch is left behind
+        i = len(key)
+        while i > 1 and not path[i - 1].count:
+            i -= 1
+        del path[i - 1].children[key[i - 1]]
+        return removed
+
+    def items(self, key=()):
+        # (key, value) of the subtree rooted at key in OID order
+        node = self._node(key)
+        if node is None:
+            return iter(())
+        return self._items(node, tuple(key))
+
+    def _items(self, node, key):
+        stack = [(key, node)]
+        while stack:
+            key, node = stack.pop()
+            if node.value is not _MISSING:
+                yield key, node.value
+            for sub_id in sorted(node.children, reverse=True):
+                stack.append((key + (sub_id,), node.children[sub_id]))
@@ -10,10 +10,17 @@ logger.addHandler(NullHandler())
 # --------------------------------------------
 
 import time
+import asyncio
+import inspect
 import threading
 from queue import Full
 from collections import OrderedDict
+from concurrent.futures import Future
 import pyagentx3
+from pyagentx3.pdu import PDU
+from pyagentx3.mib import MIBSegment
+from pyagentx3.table import Table
+from pyagentx3.varbind import VarBind
 
 
 class Updater(threading.Thread):
@@ -27,41 +34,158 @@ class Updater(threading.Thread):
         self._freq = None
         self._data = None
         self._traps = None
+        self._pre_encode = False
+        self._delta = False
+        self._previous = None
+        self._tables = {}
 
-    def agent_setup(self, queue, oid, freq):
+    def agent_setup(self, queue, oid, freq, pre_encode=False, delta=False):
         self.stop = threading.Event()
         self._queue = queue
         self._oid = oid
         self._freq = freq
+        self._pre_encode = pre_encode
+        self._delta = delta
+        self._previous = None
         self._data = {}
         self._traps = {}
 
     def run(self):
-        start_time = 0
+        # Used if the updater is started as its own thread, Agent runs
+        # run_once() from its shared scheduler instead.
+        start_time = None
         while True:
             if self.stop.is_set():
                 break
-            now = time.time()
-            if now - start_time > self._freq:
-                logger.info('Updating : %s (%s)', self.__class__.__name__, self._oid)
+            now = time.monotonic()
+            if start_time is None or now - start_time > self._freq:
                 start_time = now
-                self._data = {}
-                try:
-                    self.update()
-                    self._queue.put_nowait({'oid': self._oid,
-                                            'data': self._data})
-                except Full:
-                    logger.error('Queue full')
-                except Exception as e:
-                    logger.exception('Unhandled update exception')
+                self.run_once()
             time.sleep(0.1)
         logger.info('Updater stopping')
 
+    def run_once(self):
+        logger.info('Updating : %s (%s)', self.__class__.__name__, self._oid)
+        self._reset()
+        try:
+            self.update()
+            self._publish()
+        except Full:
+            logger.error('Queue full')
+        except Exception as e:
+            logger.exception('Unhandled update exception')
+
+    def run_once_in_process(self, executor):
+        # Run update() in a worker process of executor, only the resulting
+        # rows and traps are sent back to this process.
+        logger.info('Updating : %s (%s) in process', self.__class__.__name__, self._oid)
+        try:
+            future = executor.submit(_process_update, self.__class__,
+                self.data_store, self._oid, self._pre_encode)
+            self._data, tables, traps = future.result()
+            self._enqueue(tables)
+            for trap in traps:
+                self._queue.put_nowait(trap)
+        except Full:
+            logger.error('Queue full')
+        except Exception as e:
+            logger.exception('Unhandled update exception')
+
+    async def async_run(self):
+        # Used instead of run() by AsyncAgent, runs the updater as task
+        # in the event loop. update() may be a coroutine function.
+        loop = asyncio.get_running_loop()
+        while not self.stop.is_set():
+            logger.info('Updating : %s (%s)', self.__class__.__name__, self._oid)
+            start_time = loop.time()
+            self._reset()
+            try:
+                result = self.update()
+                if inspect.isawaitable(result):
+                    await result
+                self._publish()
+            except (Full, asyncio.QueueFull):
+                logger.error('Queue full')
+            except Exception as e:
+                logger.exception('Unhandled update exception')
+            await asyncio.sleep(max(0, start_time + self._freq - loop.time()))
+        logger.info('Updater stopping')
+
+    def _reset(self):
+        self._data = {}
+        for table in self._tables.values():
+            table.clear()
+
+    def _publish(self):
+        if self._pre_encode:
+            self.encode_data()
+        self._enqueue()
+
+    def _table_segments(self):
+        return [table.segment(self._oid) for table in self._tables.values()]
+
+    def _enqueue(self, tables=None):
+        if self._delta and self._previous is not None:
+            # Only send what changed since the last cycle
+            changed, removed = self._diff(self._previous, self._data)
+            if changed or removed:
+                self._queue.put_nowait({'oid': self._oid,
+                                        'changed': changed,
+                                        'removed': removed})
+        else:
+            # The sorted snapshot of the subtree is built here, the network
+            # thread only swaps it in.
+            self._queue.put_nowait({'oid': self._oid,
+                                    'segment': MIBSegment(self._oid, self._data)})
+            if not self._delta:
+                # The segment has its own compact copy, don't keep the
+                # VarBinds until the next cycle
+                self._data = {}
+        # Only remembered once queued, a dropped update is part of the
+        # next delta.
+        if self._delta:
+            self._previous = self._data
+        # Tables are always sent as a whole, sorting the rows is cheap
+        # compared to diffing them.
+        if tables is None:
+            tables = self._table_segments()
+        for segment in tables:
+            self._queue.put_nowait({'oid': segment.oid, 'segment': segment})
+
+    @staticmethod
+    def _diff(previous, data):
+        changed = {}
+        for name, row in data.items():
+            old = previous.get(name)
+            if (old is None or old.type != row.type or
+                    old.value != row.value):
+                changed[name] = row
+        removed = [name for name in previous if name not in data]
+        return changed, removed
+
     # Override this
     def update(self):
         pass
 
+    def add_table(self, oid, columns, index, implied=False):
+        # Declare a conceptual table below the updater's subtree, oid is
+        # the relative OID of the table entry. Usually called from
+        # __init__, rows are filled in update().
+        table = Table(oid, columns, index, implied)
+        self._tables[table.oid] = table
+        return table
+
+    def encode_data(self):
+        # Encode all values of this update cycle into ready to send
+        # varbinds, so the network thread only has to concatenate them.
+        for row in self._data.values():
+            row.varbind = PDU.encode_value(row.type,
+                "%s.%s" % (self._oid, row.name), row.value)
+
     def send_trap(self, trap_oid, *values):
+        # Returns a future resolved with the master's response, it fails
+        # with a ResponseError if the master rejected the trap. Cancelled
+        # if the trap couldn't be queued.
         logger.info('Send Trap : %s (%s)', self.__class__.__name__, trap_oid)
         logger.info('Send Trap : %s', values)
 
@@ -70,12 +194,17 @@ class Updater(threading.Thread):
         data['1.3.6.1.6.3.1.1.4.1.0'] = self._OBJECTIDENTIFIER('1.3.6.1.6.3.1.1.4.1.0', trap_oid)
         for value in values:
             data[value['name']] = value
+        future = Future()
         try:
-            self._queue.put_nowait({'trap_oid': trap_oid, 'data': data})
-        except Full:
-            logger.error('Queue full')
+            self._queue.put_nowait({'trap_oid': trap_oid, 'data': data,
+                                    'future': future})
+        except (Full, asyncio.QueueFull):
+            logger.error('Trap queue full')
+            future.cancel()
         except Exception as e:
             logger.exception('Unhandled trap exception')
+            future.cancel()
+        return future
 
     def set_INTEGER(self, oid, value):
         logger.debug('Setting INTEGER %s = %s', oid, value)
@@ -116,37 +245,68 @@ class Updater(threading.Thread):
 
     @staticmethod
     def _INTEGER(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_INTEGER, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_INTEGER, value)
 
     @staticmethod
     def _OCTETSTRING(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_OCTETSTRING, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_OCTETSTRING, value)
 
     @staticmethod
     def _OBJECTIDENTIFIER(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_OBJECTIDENTIFIER, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_OBJECTIDENTIFIER, value)
 
     @staticmethod
     def _IPADDRESS(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_IPADDRESS, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_IPADDRESS, value)
 
     @staticmethod
     def _COUNTER32(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_COUNTER32, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_COUNTER32, value)
 
     @staticmethod
     def _GAUGE32(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_GAUGE32, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_GAUGE32, value)
 
     @staticmethod
     def _TIMETICKS(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_TIMETICKS, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_TIMETICKS, value)
 
     @staticmethod
     def _OPAQUE(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_OPAQUE, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_OPAQUE, value)
 
     @staticmethod
     def _COUNTER64(oid, value):
-        return {'name': oid, 'type':pyagentx3.TYPE_COUNTER64, 'value':value}
+        return VarBind(oid, pyagentx3.TYPE_COUNTER64, value)
+
+
+class _TrapList(list):
+
+    # Collects traps of an updater running in a worker process, they are
+    # put on the real queue once the rows are back in the agent process.
+    # Futures can't be sent back, they are cancelled.
+
+    def put_nowait(self, item):
+        item = dict(item)
+        item.pop('future').cancel()
+        self.append(item)
+
+
+# Updater instances of a worker process, kept between update cycles
+_process_updaters = {}
 
+def _process_update(class_, data_store, oid, pre_encode):
+    # Runs in the worker process
+    updater = _process_updaters.get((class_, oid))
+    if updater is None:
+        updater = class_(data_store=data_store)
+        updater.agent_setup(None, oid, 0, pre_encode)
+        _process_updaters[(class_, oid)] = updater
+    else:
+        updater.data_store = data_store
+    updater._queue = _TrapList()
+    updater._reset()
+    updater.update()
+    if updater._pre_encode:
+        updater.encode_data()
+    return updater._data, updater._table_segments(), list(updater._queue)
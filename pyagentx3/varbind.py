@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# --------------------------------------------
+import logging
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+logger = logging.getLogger('pyagentx3.varbind')
+logger.addHandler(NullHandler())
+# --------------------------------------------
+
+
+class VarBind():
+
+    # Compact value of a single OID. Uses slots instead of a dict per
+    # value but still supports the dict style access (row['name'],
+    # row.get('varbind')) used for values throughout the package.
+
+    __slots__ = ('name', 'type', 'value', 'varbind')
+
+    def __init__(self, name, type_, value, varbind=None):
+        self.name = name
+        self.type = type_
+        self.value = value
+        # Pre-encoded varbind, if any
+        self.varbind = varbind
+
+    @classmethod
+    def from_row(cls, row):
+        if isinstance(row, cls):
+            return row
+        return cls(row['name'], row['type'], row['value'], row.get('varbind'))
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key == 'varbind':
+            return self.varbind is not None
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if not isinstance(other, VarBind):
+            return NotImplemented
+        return (self.name == other.name and self.type == other.type and
+                self.value == other.value)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{'name': %r, 'type': %r, 'value': %r}" % (
+            self.name, self.type, self.value)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import pyagentx3
+from pyagentx3.mib import MIB, MIBSegment, DELTA_SPLICE_MAX
+from pyagentx3.varbind import VarBind
+
+
+ROOT = '1.3.6.1.4.1.8072.2.1'
+ROWS = 100000
+
+
+def _row(name, value):
+    return VarBind(name, pyagentx3.TYPE_INTEGER, value)
+
+
+class MIBSegmentDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        # Even indexes only, so there is room to insert between them
+        self.data = {'1.%d' % i: _row('1.%d' % i, i)
+                     for i in range(0, 2 * ROWS, 2)}
+        self.segment = MIBSegment(ROOT, self.data)
+
+    def _check(self, names):
+        # Values of names and their successors are the ones of self.data
+        mib = MIB()
+        mib.replace(self.segment)
+        self.assertEqual(len(self.segment), len(self.data))
+        order = sorted(self.data, key=lambda n: int(n.split('.')[1]))
+        for name in names:
+            oid = '%s.%s' % (ROOT, name)
+            row = mib.get(oid)
+            if name in self.data:
+                self.assertEqual(row['value'], self.data[name].value)
+            else:
+                self.assertIsNone(row)
+            following = [n for n in order
+                         if int(n.split('.')[1]) > int(name.split('.')[1])]
+            row = mib.get_next(oid)
+            if following:
+                self.assertEqual(row['name'], '%s.%s' % (ROOT, following[0]))
+            else:
+                self.assertIsNone(row)
+
+    def test_small_delta_is_spliced(self):
+        # A few added or removed OIDs must not rebuild the whole segment
+        def rebuild(rows):
+            self.fail('Segment rebuilt for a small delta')
+        self.segment._set_rows = rebuild
+
+        changed = {name: _row(name, -1) for name in ['1.1', '1.1001',
+                   '1.%d' % (2 * ROWS + 1), '1.1000']}
+        removed = ['1.0', '1.5000', '1.%d' % (2 * ROWS - 2)]
+        self.segment.apply_delta(changed, removed)
+        for name in removed:
+            del self.data[name]
+        self.data.update(changed)
+        self._check(list(changed) + removed)
+
+    def test_pre_encoded_varbinds_follow_splices(self):
+        row = _row('1.3', 3)
+        row.varbind = b'encoded'
+        self.segment.apply_delta({'1.3': row}, ['1.2'])
+        mib = MIB()
+        mib.replace(self.segment)
+        self.assertEqual(mib.get(ROOT + '.1.3')['varbind'], b'encoded')
+        self.assertIsNone(mib.get(ROOT + '.1.4')['varbind'])
+        self.assertIsNone(mib.get(ROOT + '.1.2'))
+
+    def test_copy_is_independent(self):
+        copy = self.segment.copy()
+        self.segment.apply_delta({'1.7': _row('1.7', 7)}, ['1.4'])
+        self.assertEqual(len(copy), ROWS)
+        self.assertIsNotNone(copy.get(copy.key + (1, 4)))
+        self.assertIsNone(copy.get(copy.key + (1, 7)))
+
+    def test_big_delta(self):
+        changed = {'1.%d' % i: _row('1.%d' % i, i)
+                   for i in range(1, 2 * (DELTA_SPLICE_MAX + 1) + 1, 2)}
+        self.segment.apply_delta(changed, ['1.0'])
+        del self.data['1.0']
+        self.data.update(changed)
+        self._check(list(changed)[::16] + ['1.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from pyagentx3.oid import OID
+
+
+class OIDTest(unittest.TestCase):
+
+    def test_in_subtree(self):
+        oid = OID('1.3.6.1.4.1.8072.2.1.0')
+        self.assertTrue(oid.in_subtree('1.3.6.1.4.1.8072.2'))
+        self.assertTrue(oid.in_subtree(OID('1.3.6.1.4.1.8072.2.1.0')))
+        self.assertTrue(oid.in_subtree((1, 3, 6)))
+        self.assertTrue(oid.in_subtree(''))
+        # Only whole sub-identifiers match
+        self.assertFalse(oid.in_subtree('1.3.6.1.4.1.807'))
+        self.assertFalse(oid.in_subtree('1.3.6.1.4.1.8072.2.1.0.1'))
+
+    def test_interned(self):
+        oid = OID('1.3.6.1')
+        self.assertIs(oid, OID((1, 3, 6, 1)))
+        self.assertEqual(oid, '1.3.6.1')
+        self.assertLess(oid, '1.3.6.1.0')
+        self.assertGreater(oid, '1.3.6.0.5')
+
+    def test_from_bytes(self):
+        oid = OID('1.3.6.1.4.1.8072.2.1.0')
+        parsed, include, pos = OID.from_bytes(oid.encoded(1))
+        self.assertIs(parsed, oid)
+        self.assertEqual(include, 1)
+        self.assertEqual(pos, len(oid.encoded(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
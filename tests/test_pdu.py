@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+import pyagentx3
+from pyagentx3.pdu import PDU
+from pyagentx3.session import Session
+
+
+def _raw(pdu_type, payload, packet_id=7):
+    return struct.pack('!BBBBLLLL', 1, pdu_type, 0x10, 0, 42, 1, packet_id,
+        len(payload)) + payload
+
+
+class _Session(Session):
+
+    # Session keeping the PDUs it sends
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.sent = []
+
+    def send_pdu(self, pdu):
+        self.sent.append(pdu)
+
+
+class MalformedPDUTest(unittest.TestCase):
+
+    def test_short_getbulk_is_a_parse_error(self):
+        pdu = PDU()
+        pdu.decode(_raw(pyagentx3.AGENTX_GETBULK_PDU, b'\x00\x01'))
+        self.assertEqual(pdu.error, pyagentx3.ERROR_PARSEERROR)
+
+    def test_parse_error_is_answered(self):
+        pdu = PDU()
+        pdu.decode(_raw(pyagentx3.AGENTX_GET_PDU, b'\x05\x00\x00\x00\x01'))
+        response = Session([], {}, 'test')._dispatch(pdu)
+        self.assertEqual(response.type, pyagentx3.AGENTX_RESPONSE_PDU)
+        self.assertEqual(response.error, pyagentx3.ERROR_PARSEERROR)
+        self.assertEqual(response.packet_id, 7)
+
+    def test_valid_getbulk(self):
+        oid = PDU.encode_oid('1.3.6.1.4.1.8072.2')
+        pdu = PDU()
+        pdu.decode(_raw(pyagentx3.AGENTX_GETBULK_PDU,
+            struct.pack('!HH', 0, 5) + oid + PDU.encode_oid('')))
+        self.assertEqual(pdu.error, pyagentx3.ERROR_NOAGENTXERROR)
+        self.assertEqual(pdu.max_repetitions, 5)
+        self.assertEqual(pdu.range_list[0][0], '1.3.6.1.4.1.8072.2')
+
+
+class RegistrationTest(unittest.TestCase):
+
+    def test_registered_per_oid(self):
+        # .2.1 and .2.2 go out as one range REGISTER PDU
+        oids = ['1.3.6.1.4.1.8072.2.1', '1.3.6.1.4.1.8072.2.2',
+                '1.3.6.1.4.1.8072.3']
+        session = _Session(oids, {}, 'test')
+        registered = []
+        session.on_register = lambda oid, error: registered.append(oid)
+        session.start_registration()
+        self.assertEqual(len(session.sent), 2)
+        for request in session.sent:
+            response = PDU()
+            response.decode(session.response_pdu(request).encode())
+            session._process_response(response)
+        self.assertEqual(sorted(registered), oids)
+
+
+if __name__ == '__main__':
+    unittest.main()
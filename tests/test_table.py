@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import pyagentx3
+from pyagentx3.table import Table, TableError, encode_index
+
+
+class EncodeIndexTest(unittest.TestCase):
+
+    def test_encode(self):
+        self.assertEqual(encode_index([pyagentx3.TYPE_INTEGER,
+            pyagentx3.TYPE_OCTETSTRING, pyagentx3.TYPE_IPADDRESS],
+            (0xffffffff, 'ab', '10.0.0.1')),
+            (0xffffffff, 2, 97, 98, 10, 0, 0, 1))
+
+    def test_out_of_range(self):
+        for index_type, value in [
+                (pyagentx3.TYPE_INTEGER, -1),
+                (pyagentx3.TYPE_GAUGE32, 2 ** 32),
+                (pyagentx3.TYPE_IPADDRESS, '10.0.0.256'),
+                (pyagentx3.TYPE_OCTETSTRING, [1, 256]),
+                (pyagentx3.TYPE_OCTETSTRING, '€'),
+                (pyagentx3.TYPE_OBJECTIDENTIFIER, '1.3.%d' % 2 ** 32)]:
+            with self.assertRaises(TableError):
+                encode_index([index_type], value)
+
+    def test_add_row(self):
+        table = Table('2.1', {2: pyagentx3.TYPE_INTEGER},
+                      [pyagentx3.TYPE_INTEGER])
+        with self.assertRaises(TableError):
+            table.add_row(-1, 5)
+        self.assertEqual(table._keys, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import unittest
+from pyagentx3.transport import parse_address, TransportError
+
+
+class ParseAddressTest(unittest.TestCase):
+
+    def test_tcp(self):
+        for address, expected in [
+                ('tcp:snmpd:1705', (socket.AF_INET, ('snmpd', 1705))),
+                ('tcp:snmpd', (socket.AF_INET, ('snmpd', 705))),
+                ('tcp:705', (socket.AF_INET, ('localhost', 705))),
+                ('tcp:1705', (socket.AF_INET, ('localhost', 1705))),
+                ('tcp::1705', (socket.AF_INET, ('localhost', 1705))),
+                ('tcp:[::1]:705', (socket.AF_INET6, ('::1', 705))),
+                ('tcp:[fe80::1]', (socket.AF_INET6, ('fe80::1', 705))),
+                ('tcp:[]:1705', (socket.AF_INET6, ('::1', 1705)))]:
+            self.assertEqual(parse_address(address), expected, address)
+
+    def test_unix(self):
+        self.assertEqual(parse_address('unix:/var/agentx/master'),
+                         (socket.AF_UNIX, '/var/agentx/master'))
+        self.assertEqual(parse_address('/var/agentx/master'),
+                         (socket.AF_UNIX, '/var/agentx/master'))
+
+    def test_invalid_port(self):
+        with self.assertRaises(TransportError):
+            parse_address('tcp:snmpd:agentx')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from pyagentx3.trie import OIDTrie
+
+
+class OIDTrieTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = OIDTrie()
+        for key in [(1, 3), (1, 3, 6, 1), (1, 3, 6, 1, 2), (1, 3, 6, 2),
+                    (1, 4, 1, 1)]:
+            self.trie[key] = key
+
+    def test_items(self):
+        self.assertEqual([key for key, _ in self.trie.items()],
+            [(1, 3), (1, 3, 6, 1), (1, 3, 6, 1, 2), (1, 3, 6, 2),
+             (1, 4, 1, 1)])
+        self.assertEqual([key for key, _ in self.trie.items((1, 3, 6))],
+            [(1, 3, 6, 1), (1, 3, 6, 1, 2), (1, 3, 6, 2)])
+        self.assertEqual(list(self.trie.items((2,))), [])
+
+    def test_delete(self):
+        self.assertEqual(self.trie.delete((1, 3, 6, 1)), 2)
+        self.assertEqual(len(self.trie), 3)
+        self.assertNotIn((1, 3, 6, 1, 2), self.trie)
+        self.assertIn((1, 3, 6, 2), self.trie)
+        self.assertEqual(self.trie.delete((1, 3, 6, 1)), 0)
+        # No empty branch is left behind
+        self.assertEqual(self.trie.delete((1, 4, 1, 1)), 1)
+        self.assertEqual(list(self.trie._root.children[1].children), [3])
+        self.assertEqual(self.trie.delete((1,)), 2)
+        self.assertEqual(len(self.trie), 0)
+        self.assertEqual(self.trie._root.children, {})
+
+    def test_delete_all(self):
+        self.assertEqual(self.trie.delete(()), 5)
+        self.assertEqual(len(self.trie), 0)
+        self.assertIsNone(self.trie.get((1, 3)))
+
+    def test_prefixes(self):
+        self.assertEqual(self.trie.longest_prefix((1, 3, 6, 1, 9)),
+                         ((1, 3, 6, 1), (1, 3, 6, 1)))
+        self.assertEqual(self.trie.longest_prefix((1, 4, 1)), (None, None))
+        self.trie[(1, 3)] = 'replaced'
+        self.assertEqual(len(self.trie), 5)
+        self.assertEqual([length for length, _ in
+                          self.trie.prefixes((1, 3, 6, 1, 2))], [5, 4, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()